@@ -0,0 +1,136 @@
+import io
+import sys
+import math
+import time
+import shutil
+import tempfile
+import warnings
+import platform
+import contextlib
+import multiprocessing
+from pathlib import Path    #
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+import obsidianhtml
+from .VaultGenerator import VaultGenerator
+from .StageTimer import StageTimer
+
+def WriteConfig(config_path, vault_path, entrypoint_path, output_path, toggles=None):
+    """Write a config for a full (non-incremental) build of the vault to the output folder. `toggles` are set on top of the defaults."""
+    conf = {
+        'obsidian_folder_path_str': str(vault_path),
+        'obsidian_entrypoint_path_str': str(entrypoint_path),
+        'md_folder_path_str': str(output_path.joinpath('md')),
+        'md_entrypoint_path_str': str(output_path.joinpath('md', 'index.md')),
+        'html_output_folder_path_str': str(output_path.joinpath('html')),
+        'site_name': 'Benchmark',
+        'html_url_prefix': '',
+        'html_template_path_str': '',
+        'exclude_subfolders': ['.obsidian'],
+        'toggles': {
+            'compile_md': True,
+            'compile_html': True,
+            'process_all': True,
+            'verbose_printout': False,
+            'allow_duplicate_filenames_in_root': False,
+            'warn_on_skipped_image': True,
+            'no_clean': False,
+            'relative_path_md': True,
+            'features': {'build_graph': True},
+        },
+    }
+    for key, value in (toggles or {}).items():
+        if key == 'features':
+            conf['toggles']['features'].update(value)
+        else:
+            conf['toggles'][key] = value
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.dump(conf, f)
+
+def RunBuild(config_path, jobs=1):
+    """Run obsidianhtml on the config in this process, and return the seconds spent per stage (and in total).
+    The output of the build is swallowed."""
+    argv = sys.argv
+    sys.argv = ['obsidianhtml', '-i', str(config_path), '--jobs', str(jobs)]
+    try:
+        with StageTimer() as timer, contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            start = time.perf_counter()
+            obsidianhtml.main()
+            total = time.perf_counter() - start
+    finally:
+        sys.argv = argv
+    return dict(timer.timings, total=total)
+
+def RunColdBuild(config_path, jobs=1):
+    """RunBuild() in a new process. The package keeps caches per process (parsed links, packaged files, copied files),
+    so every build after the first one in a process would be timed with warm caches, unlike a real build."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(RunBuild, config_path, jobs).result()
+
+def RunBenchmark(settings, jobs=1, repeat=3, toggles=None, work_path=None):
+    """Generate a vault with the given settings (see VaultGenerator), build it `repeat` times, and return the results.
+    Every build runs in a new process (see RunColdBuild). The fastest time of every stage is reported, as it is the least disturbed by other processes."""
+    work_path = Path(tempfile.mkdtemp(prefix='obsidianhtml-benchmark-', dir=work_path))
+    try:
+        generator = VaultGenerator(**settings)
+        entrypoint_path = generator.Generate(work_path.joinpath('vault'))
+        config_path = work_path.joinpath('config.yml')
+        WriteConfig(config_path, work_path.joinpath('vault'), entrypoint_path, work_path.joinpath('output'), toggles)
+
+        runs = [RunColdBuild(config_path, jobs) for _ in range(repeat)]
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    best = {stage: min(run[stage] for run in runs) for stage in runs[0].keys()}
+    notes = generator.settings['notes'] + 1
+    return {
+        'settings': generator.settings,
+        'toggles': toggles or {},
+        'jobs': jobs,
+        'runs': runs,
+        'best': best,
+        'per_note_ms': {stage: 1000 * seconds / notes for stage, seconds in best.items()},
+    }
+
+def GetEnvironment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'obsidianhtml': obsidianhtml.__file__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def GetGrowthExponent(sizes, seconds):
+    """Least squares slope of log(seconds) against log(size): 1 for linear growth, 2 for quadratic growth."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(s, 1e-6)) for s in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+
+def RunScaling(parameter, sizes, settings, stages, max_exponent, jobs=1, repeat=3, toggles=None, min_seconds=0.25):
+    """Benchmark the vault for every value of one setting (e.g. notes or links_per_note), and check that the time of the
+    given stages grows at most with `max_exponent` (see GetGrowthExponent). A build that is linear in the size of the vault
+    has an exponent of about 1 for 'notes', and below 1 for the densities, as every note also has a fixed cost.
+    Stages that stay below `min_seconds` are too short to time reliably, and are not checked."""
+    results = []
+    for size in sizes:
+        results.append(RunBenchmark(dict(settings, **{parameter: size}), jobs, repeat, toggles))
+
+    checks = {}
+    for stage in stages:
+        seconds = [result['best'][stage] for result in results]
+        exponent = GetGrowthExponent(sizes, seconds)
+        checked = max(seconds) >= min_seconds
+        checks[stage] = {'exponent': exponent, 'max_exponent': max_exponent, 'checked': checked, 'passed': exponent <= max_exponent or checked == False}
+
+    return {
+        'parameter': parameter,
+        'sizes': sizes,
+        'results': results,
+        'checks': checks,
+        'passed': all(check['passed'] for check in checks.values()),
+    }
@@ -0,0 +1,56 @@
+import time
+import functools
+
+import obsidianhtml
+from obsidianhtml.FileScanner import FileScanner
+from obsidianhtml.HtmlRenderer import HtmlRenderer
+from obsidianhtml.NetworkTree import NetworkTree
+from obsidianhtml.SearchIndex import SearchIndex
+
+class StageTimer:
+    """Measures the time spent in every stage of a build, by wrapping the functions that run them while the timer is active.
+
+    Stages are timed in the main process. With jobs > 1, the html pages and tag pages are rendered by the workers
+    while the main process goes on, so part of their time shows up under 'wait_for_workers'.
+    """
+    # Stage -> (owner, attribute) of the functions that are timed as that stage
+    stages = {
+        'scan':             [(FileScanner, 'Scan')],
+        'link_index':       [(obsidianhtml, 'BuildObsidianLinkIndex'), (obsidianhtml, 'BuildMarkdownLinkIndex')],
+        'markdown':         [(obsidianhtml, 'ConvertObsidianNotesToMarkdown')],
+        'html':             [(obsidianhtml, 'ConvertMarkdownPagesToHtml')],
+        'tag_pages':        [(obsidianhtml, 'WriteTagPages')],
+        'wait_for_workers': [(HtmlRenderer, 'WaitForWorkers')],
+        'search_index':     [(SearchIndex, 'Export')],
+        'static_files':     [(obsidianhtml, 'ExportStaticFiles')],
+        'graph':            [(NetworkTree, 'WriteJson'), (NetworkTree, 'WriteNeighbourhoodShards')],
+    }
+    timings = None          # Stage -> seconds
+    originals = None        # [(owner, attribute, original function)]
+
+    def __init__(self):
+        self.timings = {stage: 0.0 for stage in self.stages.keys()}
+        self.originals = []
+
+    def __enter__(self):
+        for stage, targets in self.stages.items():
+            for owner, attribute in targets:
+                original = getattr(owner, attribute)
+                self.originals.append((owner, attribute, original))
+                setattr(owner, attribute, self.Wrap(stage, original))
+        return self
+
+    def __exit__(self, *args):
+        for owner, attribute, original in reversed(self.originals):
+            setattr(owner, attribute, original)
+        self.originals = []
+
+    def Wrap(self, stage, function):
+        @functools.wraps(function)
+        def Timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.timings[stage] += time.perf_counter() - start
+        return Timed
@@ -0,0 +1,106 @@
+import random
+import base64
+from pathlib import Path    #
+
+# A valid 1x1 png, written for every image of the vault
+_png_bytes = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+class VaultGenerator:
+    """Writes a synthetic Obsidian vault of which the size and the density of every kind of link can be set.
+
+    The same settings (including the seed) always give the same vault, so that timings of different runs can be compared.
+    Embeds (whole notes and sections) only point to leaf notes, which embed nothing themselves, so that the size of
+    a converted note does not explode with the number of notes, and there are no inclusion cycles.
+    """
+    defaults = {
+        'notes': 500,                       # Number of notes, next to the entrypoint (index.md)
+        'links_per_note': 10,               # Wikilinks to random notes
+        'embeds_per_note': 1,               # ![[note]] of a leaf note
+        'section_embeds_per_note': 1,       # ![[note#header]] of a leaf note
+        'sections_per_note': 4,             # Headers in every note
+        'paragraphs_per_section': 2,
+        'code_blocks_per_note': 1,
+        'tags_per_note': 2,
+        'tag_count': 50,                    # Number of distinct tags, half of which are nested (group/tag)
+        'images': 50,                       # Number of images in the vault
+        'images_per_note': 1,
+        'folder_depth': 3,                  # Notes are spread over folders up to this depth
+        'leaf_fraction': 0.1,               # Part of the notes that can be embedded
+        'seed': 1,
+    }
+    settings = None
+
+    def __init__(self, **settings):
+        for key in settings.keys():
+            if key not in self.defaults.keys():
+                raise Exception(f'Unknown vault setting "{key}". Known settings: {", ".join(self.defaults.keys())}')
+        self.settings = dict(self.defaults, **settings)
+
+    def Generate(self, vault_path):
+        """Write the vault to the given folder, and return the path of its entrypoint."""
+        s = self.settings
+        rng = random.Random(s['seed'])
+        vault_path = Path(vault_path)
+        vault_path.mkdir(parents=True, exist_ok=True)
+
+        words = self.GetVocabulary(rng)
+        tags = [f'tag{i}' if i % 2 == 0 else f'group{i % 5}/tag{i}' for i in range(s['tag_count'])]
+        note_names = [f'Note {i}' for i in range(s['notes'])]
+        leaf_count = max(1, int(s['notes'] * s['leaf_fraction']))
+        leaf_names = note_names[len(note_names) - leaf_count:]
+
+        # Images
+        image_names = [f'image {i}.png' for i in range(s['images'])]
+        vault_path.joinpath('images').mkdir(exist_ok=True)
+        for name in image_names:
+            with open(vault_path.joinpath('images', name), 'wb') as f:
+                f.write(_png_bytes)
+
+        # Notes
+        for i, name in enumerate(note_names):
+            is_leaf = (i >= len(note_names) - leaf_count)
+            folder_path = vault_path.joinpath(*[f'folder {rng.randrange(4)}' for _ in range(rng.randint(0, s['folder_depth']))])
+            folder_path.mkdir(parents=True, exist_ok=True)
+            with open(folder_path.joinpath(f'{name}.md'), 'w', encoding='utf-8') as f:
+                f.write(self.GetNote(rng, name, is_leaf, words, tags, note_names, leaf_names, image_names))
+
+        # The entrypoint links to every note, so that all of them are converted, also without process_all
+        entrypoint_path = vault_path.joinpath('index.md')
+        with open(entrypoint_path, 'w', encoding='utf-8') as f:
+            f.write('# Index\n' + ''.join(f'- [[{name}]]\n' for name in note_names))
+        return entrypoint_path
+
+    def GetVocabulary(self, rng, size=2000):
+        syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'so', 'vi', 'de', 'po', 'zu', 'an', 'er', 'is', 'ol']
+        return [''.join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+    def GetText(self, rng, words, length):
+        return ' '.join(rng.choice(words) for _ in range(length))
+
+    def GetNote(self, rng, name, is_leaf, words, tags, note_names, leaf_names, image_names):
+        s = self.settings
+        sections = max(1, s['sections_per_note'])
+
+        # Everything that goes into the body of a note, spread over its sections
+        items = [f'[[{rng.choice(note_names)}]]' for _ in range(s['links_per_note'])]
+        items += [f'![[{rng.choice(image_names)}]]' for _ in range(s['images_per_note'] if len(image_names) > 0 else 0)]
+        items += ['```python\n' + '\n'.join(f'{rng.choice(words)} = "{rng.choice(words)}"' for _ in range(4)) + '\n```' for _ in range(s['code_blocks_per_note'])]
+        if not is_leaf:
+            items += [f'![[{rng.choice(leaf_names)}]]' for _ in range(s['embeds_per_note'])]
+            items += [f'![[{rng.choice(leaf_names)}#Section {rng.randrange(sections) + 1}]]' for _ in range(s['section_embeds_per_note'])]
+        rng.shuffle(items)
+
+        lines = ['---', 'tags:'] + [f'  - {tag}' for tag in rng.sample(tags, min(s['tags_per_note'], len(tags)))] + ['---', f'# {name}']
+        for k in range(sections):
+            lines.append(f'## Section {k + 1}')
+            for p in range(s['paragraphs_per_section']):
+                lines.append(self.GetText(rng, words, rng.randint(20, 60)))
+                lines.append('')
+            # Links stay inline in the text, embeds and code blocks are on their own line
+            for item in items[k::sections]:
+                if item.startswith('[['):
+                    lines.append(self.GetText(rng, words, 5) + f' {item} ' + self.GetText(rng, words, 5))
+                else:
+                    lines.append(item)
+                lines.append('')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1 @@
+"""Benchmarks of obsidianhtml on synthetic vaults. Run with `python -m benchmarks -h`, see docs/developer_docs.md."""
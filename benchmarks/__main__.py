@@ -0,0 +1,105 @@
+import sys
+import json
+import argparse
+from pathlib import Path    #
+
+from .VaultGenerator import VaultGenerator
+from .Benchmark import RunBenchmark, RunScaling, GetEnvironment
+
+# Stages of which the time should grow linearly with the size of the vault (see RunScaling), per scenario.
+# The graph is left out of links_per_note: the shard of a note holds its neighbours and the links between them,
+# which grow quadratically with the links per note (until a shard is the whole graph).
+scaling_stages = {
+    'notes':          ['scan', 'link_index', 'markdown', 'html', 'tag_pages', 'graph', 'total'],
+    'links_per_note': ['scan', 'link_index', 'markdown', 'html', 'tag_pages', 'total'],
+}
+
+def AddVaultArguments(parser):
+    for key, value in VaultGenerator.defaults.items():
+        parser.add_argument('--' + key.replace('_', '-'), dest=key, type=type(value), default=value)
+
+def GetVaultSettings(args):
+    return {key: getattr(args, key) for key in VaultGenerator.defaults.keys()}
+
+def GetToggles(args):
+    toggles = {}
+    if args.no_write_md:
+        toggles['write_md_folder'] = False
+    if args.no_search:
+        toggles['features'] = {'build_search_index': False}
+    return toggles
+
+def WriteResults(results, output_path_str):
+    results['environment'] = GetEnvironment()
+    if output_path_str is None:
+        return
+    with open(output_path_str, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'> RESULTS WRITTEN TO {output_path_str}')
+
+def PrintStages(result):
+    print(f'{"stage":<18}{"best (s)":>10}{"per note (ms)":>16}')
+    for stage, seconds in result['best'].items():
+        print(f'{stage:<18}{seconds:>10.3f}{result["per_note_ms"][stage]:>16.3f}')
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks of obsidianhtml on synthetic vaults.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='Write a synthetic vault to a folder.')
+    generate.add_argument('vault_path')
+    AddVaultArguments(generate)
+
+    run = commands.add_parser('run', help='Time every stage of a build of a synthetic vault.')
+    scaling = commands.add_parser('scaling', help='Fail when the time per note grows with the number of notes, or faster than linear with the number of links per note.')
+    for p in (run, scaling):
+        AddVaultArguments(p)
+        p.add_argument('--jobs', type=int, default=1)
+        p.add_argument('--repeat', type=int, default=3, help='Builds per vault; the fastest time of every stage is reported.')
+        p.add_argument('--no-write-md', action='store_true', help='Run with toggles/write_md_folder = False.')
+        p.add_argument('--no-search', action='store_true', help='Run with features/build_search_index = False.')
+        p.add_argument('--output', default=None, help='Write the results to this json file.')
+    scaling.add_argument('--steps', type=int, default=3, help='Number of sizes, each twice the previous one, starting at --notes and --links-per-note.')
+    scaling.add_argument('--max-exponent', type=float, default=1.35, help='Highest allowed growth exponent of the time of a stage (1 is linear).')
+    scaling.add_argument('--min-seconds', type=float, default=0.25, help='Stages that stay below this time are not checked.')
+
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        entrypoint_path = VaultGenerator(**GetVaultSettings(args)).Generate(Path(args.vault_path).resolve())
+        print(f'> VAULT WRITTEN, ENTRYPOINT: {entrypoint_path}')
+        return
+
+    settings = GetVaultSettings(args)
+    toggles = GetToggles(args)
+
+    if args.command == 'run':
+        result = RunBenchmark(settings, args.jobs, args.repeat, toggles)
+        PrintStages(result)
+        WriteResults(result, args.output)
+        return
+
+    # [1] Time per note should stay the same when the vault grows
+    # [2] Time per link should stay the same when notes get more links (the fixed cost per note makes this sublinear)
+    scenarios = [
+        ('notes', [settings['notes'] * 2**i for i in range(args.steps)]),
+        ('links_per_note', [max(1, settings['links_per_note']) * 2**i for i in range(args.steps)]),
+    ]
+    results = {'scenarios': []}
+    for parameter, sizes in scenarios:
+        print(f'> SCALING {parameter}: {", ".join(str(size) for size in sizes)}')
+        scenario = RunScaling(parameter, sizes, settings, scaling_stages[parameter], args.max_exponent, args.jobs, args.repeat, toggles, args.min_seconds)
+        for stage, check in scenario['checks'].items():
+            times = ', '.join(f'{result["best"][stage]:.3f}' for result in scenario['results'])
+            status = 'skip' if check['checked'] == False else ('ok  ' if check['passed'] else 'FAIL')
+            print(f'{status} {stage:<12} exponent {check["exponent"]:.2f} (max {check["max_exponent"]:.2f}), seconds: {times}')
+        results['scenarios'].append(scenario)
+
+    results['passed'] = all(scenario['passed'] for scenario in results['scenarios'])
+    WriteResults(results, args.output)
+    if results['passed'] == False:
+        print('> SCALING CHECK FAILED: the time of a stage grows faster than linear')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
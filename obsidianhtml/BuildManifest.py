@@ -0,0 +1,174 @@
+import os                   #
+import json
+import hashlib
+from pathlib import Path    #
+
+class BuildManifest:
+    """Keeps track of what every converted note depended on, so that unchanged notes can be skipped on the next run.
+
+    Per stage ('md', 'html'), a record is kept per note (keyed by its path relative to the stage's input folder):
+    - hash:    content hash of the note itself
+    - dst:     path of the written output file
+    - inputs:  {fullpath: hash} of other files whose contents went into the output (inclusions, copied files)
+    - lookups: {key: fullpath or None} of every file tree lookup, so that created/removed/moved link targets are noticed
+    - links:   the links that the note recurses to, so that recursion can continue without converting the note
+    Any extra stage-specific values (graph node, tags) are stored in the record as well.
+    """
+    path = None             # Path() object of the manifest file
+    previous = None         # Manifest as written by the previous run
+    current = None          # Manifest as built up during this run
+    reusable = None         # Per stage: whether the records of the previous run can be trusted
+    hashes = None           # Cache of file hashes: path -> ((size, mtime), hash), so that a file is only read again when it changed
+
+    def __init__(self, path):
+        self.path = path
+        self.previous = {'stages': {}, 'outputs': {}}
+        self.current = {'stages': {}, 'outputs': {}}
+        self.reusable = {}
+        self.hashes = {}
+
+        if self.path.exists():
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.previous = json.load(f)
+            except ValueError:
+                # Corrupt manifest, start over
+                pass
+
+    def StartStage(self, stage, fingerprint):
+        """Start recording a stage. Records of the previous run are only reused when the fingerprint (config, version, template) is unchanged."""
+        previous_stage = self.previous['stages'].get(stage, {'fingerprint': None, 'files': {}})
+        self.reusable[stage] = (previous_stage['fingerprint'] == fingerprint)
+        self.current['stages'][stage] = {'fingerprint': fingerprint, 'files': {}}
+
+    def FileHash(self, path_str):
+        try:
+            stat = os.stat(path_str)
+        except OSError:
+            return None
+
+        version = (stat.st_size, stat.st_mtime_ns)
+        cached = self.hashes.get(path_str, None)
+        if cached is None or cached[0] != version:
+            try:
+                with open(path_str, 'rb') as f:
+                    cached = (version, hashlib.sha1(f.read()).hexdigest())
+            except OSError:
+                return None
+            self.hashes[path_str] = cached
+        return cached[1]
+
+    def GetUnchangedRecord(self, stage, key, src_path_str, files):
+        """Return the record of the previous run if neither the note nor anything it depends on has changed, otherwise None.
+        When a record is returned, it is carried over into the current manifest."""
+        if not self.reusable.get(stage, False):
+            return None
+
+        record = self.previous['stages'][stage]['files'].get(key, None)
+        if record is None:
+            return None
+
+        # The note itself
+        if record['src'] != src_path_str or record['hash'] != self.FileHash(src_path_str):
+            return None
+
+        # Files that were included or copied
+        for path_str, file_hash in record['inputs'].items():
+            if self.FileHash(path_str) != file_hash:
+                return None
+
+        # Link targets that were created, removed or moved
+        for lookup_key, path_str in record['lookups'].items():
+            current_path_str = None
+            n = files.Find(lookup_key)
+            if n is not None:
+                current_path_str = files.Fullpath(n)
+            if current_path_str != path_str:
+                return None
+
+        # Output was removed by hand
+        if Path(record['dst']).exists() == False:
+            return None
+
+        self.current['stages'][stage]['files'][key] = record
+        return record
+
+    def AddRecord(self, stage, key, src_path_str, dst_path_str, inputs, lookups, links, **extra):
+        """Record the dependencies of a freshly converted note (see MarkdownPage.inputs/lookups/links)."""
+        record = {
+            'src': src_path_str,
+            'hash': self.FileHash(src_path_str),
+            'dst': dst_path_str,
+            'inputs': {path_str: self.FileHash(path_str) for path_str in inputs},
+            'lookups': lookups,
+            'links': links,
+        }
+        record.update(extra)
+        self.current['stages'][stage]['files'][key] = record
+        return record
+
+    def RemoveStaleOutputs(self, stage, output_folder_path):
+        """Remove the output of notes that were converted in the previous run, but not in this one (e.g. deleted notes).
+        Folders that are left empty are removed as well, up to output_folder_path, so that the output is the same as that of a full build."""
+        previous_files = self.previous['stages'].get(stage, {'files': {}})['files']
+        current_files = self.current['stages'][stage]['files']
+        current_dsts = set([record['dst'] for record in current_files.values()])
+
+        for key, record in previous_files.items():
+            if key in current_files.keys() or record['dst'] in current_dsts:
+                continue
+            dst_path = Path(record['dst'])
+            if dst_path.exists():
+                dst_path.unlink()
+            self.RemoveEmptyFolders(dst_path.parent, output_folder_path)
+
+    def RemoveEmptyFolders(self, folder_path, output_folder_path):
+        """Remove folder_path and its parents for as long as they are empty, stopping at output_folder_path (which is kept)."""
+        output_folder_path = Path(output_folder_path)
+        while folder_path != output_folder_path and folder_path.is_relative_to(output_folder_path):
+            if folder_path.exists() == False:
+                folder_path = folder_path.parent
+                continue
+            with os.scandir(folder_path) as entries:
+                if any(entries):
+                    return
+            folder_path.rmdir()
+            folder_path = folder_path.parent
+
+    def OutputChanged(self, name, content):
+        """Returns True if the given content differs from the content that was recorded under this name in the previous run.
+        The content is either a string, or an iterable of strings (chunks), so that large outputs don't have to be joined first."""
+        if isinstance(content, str):
+            content = [content]
+        content_hash = hashlib.sha1()
+        for chunk in content:
+            content_hash.update(chunk.encode('utf-8'))
+        content_hash = content_hash.hexdigest()
+        self.current['outputs'][name] = content_hash
+
+        if not self.reusable.get('html', False):
+            return True
+        return self.previous['outputs'].get(name, None) != content_hash
+
+    def CarryOver(self):
+        # Stages/outputs that did not run this time are carried over as-is
+        for stage, value in self.previous['stages'].items():
+            if stage not in self.current['stages'].keys():
+                self.current['stages'][stage] = value
+        for name, value in self.previous['outputs'].items():
+            if name not in self.current['outputs'].keys():
+                self.current['outputs'][name] = value
+
+    def Restart(self):
+        """Start a new run in the same process (see --watch): the manifest built up so far becomes the previous one.
+        The file hashes are kept, as they are checked against the size and modification time of the file."""
+        self.CarryOver()
+        self.previous = self.current
+        self.current = {'stages': {}, 'outputs': {}}
+        self.reusable = {}
+
+    def Save(self):
+        self.CarryOver()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding="utf-8") as f:
+            json.dump(self.current, f)
@@ -0,0 +1,20 @@
+import re                   # regex string finding/replacing
+
+class CompiledTemplate:
+    """Template that is split once into literal text and named slots (e.g. {content}), so that rendering it is a single join.
+
+    Only the given slot names are filled in, any other {...} text is kept as is (e.g. {level} in graph_template.html, which is filled in by javascript).
+    Values are inserted as they are: a page that contains the text {title} does not get the title inserted.
+    """
+    segments = None         # Literal text and slot names, alternating: [text, slot, text, slot, ..., text]
+
+    def __init__(self, template, slot_names):
+        slot_pattern = re.compile(r'\{(' + '|'.join(re.escape(name) for name in slot_names) + r')\}')
+        self.segments = slot_pattern.split(template)
+
+    def Render(self, **values):
+        """Returns the template with every slot filled in. All slots that occur in the template must be given."""
+        parts = self.segments.copy()
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        return ''.join(parts)
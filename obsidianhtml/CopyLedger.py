@@ -0,0 +1,109 @@
+import os                   #
+import shutil               # used to remove a non-empty directory, copy files
+import filecmp
+
+from .Profiler import Count
+
+copy_modes = ['copy', 'hardlink', 'symlink', 'reflink']
+
+class CopyLedger:
+    """Puts linked files (images, attachments) in place in the output folders, at most once per destination per run.
+
+    Many notes can link to the same file, so every destination that is written is recorded, and skipped the next time it comes up.
+    A destination that is left over from a previous run is skipped as well, when it is already up to date (see IsUpToDate).
+
+    The mode (config: attachment_copy_mode) determines how a file is put in place:
+    - copy:     a normal copy, with the modification time of the source, so that the next run can tell it is up to date
+    - hardlink: a hard link to the source; falls back to copy when that is not possible (e.g. across file systems)
+    - symlink:  a symbolic link to the source
+    - reflink:  a copy through os.copy_file_range(), which file systems such as btrfs and xfs can do by sharing the data; falls back to copy
+    """
+    mode = None
+    copied = None           # Destination path -> source path of every file put in place during this run
+
+    def __init__(self, mode='copy'):
+        if mode not in copy_modes:
+            raise Exception(f"Unknown attachment_copy_mode '{mode}'. Choose one of: {', '.join(copy_modes)}.")
+        self.mode = mode
+        self.copied = {}
+
+    def Copy(self, src_path_str, dst_path):
+        dst_path_str = str(dst_path)
+        if self.copied.get(dst_path_str, None) == src_path_str:
+            Count('copy_ledger_hits')
+            return
+
+        if self.IsUpToDate(src_path_str, dst_path_str):
+            Count('copy_up_to_date')
+        else:
+            # Go via a temporary file in the destination folder, so that worker processes copying the same
+            # file at the same time never leave a half-written file behind: the last os.replace() wins.
+            tmp_path_str = str(dst_path.with_name(f'.{dst_path.name}.{os.getpid()}.tmp'))
+            self.Materialize(src_path_str, tmp_path_str)
+            os.replace(tmp_path_str, dst_path_str)
+
+        self.copied[dst_path_str] = src_path_str
+
+    def IsUpToDate(self, src_path_str, dst_path_str):
+        """Whether the destination already is what this mode would put in place."""
+        if self.mode == 'symlink':
+            return os.path.islink(dst_path_str) and os.readlink(dst_path_str) == os.path.abspath(src_path_str)
+        if os.path.islink(dst_path_str):
+            return False
+
+        try:
+            src_stat = os.stat(src_path_str)
+            dst_stat = os.stat(dst_path_str)
+        except FileNotFoundError:
+            return False
+
+        same_file = (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino)
+        if self.mode == 'hardlink' and src_stat.st_dev == dst_stat.st_dev:
+            return same_file
+        if same_file:
+            # Left over from hardlink mode
+            return False
+
+        # Same size and modification time, or else same contents
+        if src_stat.st_size != dst_stat.st_size:
+            return False
+        if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+            return True
+        if filecmp.cmp(src_path_str, dst_path_str, shallow=False) == False:
+            return False
+        os.utime(dst_path_str, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        return True
+
+    def Materialize(self, src_path_str, dst_path_str):
+        if self.mode == 'symlink':
+            os.symlink(os.path.abspath(src_path_str), dst_path_str)
+            return
+
+        if self.mode == 'hardlink':
+            try:
+                os.link(src_path_str, dst_path_str)
+                return
+            except OSError:
+                pass
+
+        copied = False
+        if self.mode == 'reflink' and hasattr(os, 'copy_file_range'):
+            try:
+                with open(src_path_str, 'rb') as src, open(dst_path_str, 'wb') as dst:
+                    remaining = os.fstat(src.fileno()).st_size
+                    while remaining > 0:
+                        n = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                        if n == 0:
+                            break
+                        remaining -= n
+                copied = (remaining == 0)
+            except OSError:
+                pass
+
+        if copied == False:
+            shutil.copyfile(src_path_str, dst_path_str)
+
+        src_stat = os.stat(src_path_str)
+        Count('files_copied')
+        Count('bytes_copied', src_stat.st_size)
+        os.utime(dst_path_str, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
@@ -0,0 +1,116 @@
+import os                   #
+import sys                  # intern strings
+from array import array
+
+class FileRegistry:
+    """Table of the files in the vault or in the markdown folder (see FileScanner), that links are resolved against.
+
+    Files are numbered in the order in which they are added, and stored column-wise (interned relative paths, arrays
+    of numbers and a bytearray of processed flags), so that a large vault does not cost a dict and Path objects per file,
+    and the table is cheap to send to the worker processes. The full path of a file is the folder path followed by its
+    relative path; only files for which that is not the case (symbolic links, see attachment_copy_mode) keep their full path.
+
+    Files are found by name or by relative path. Both lookups are built on their first use, and are left out when the table
+    is sent to a worker process, which builds the ones it uses again.
+    The key of a file (see Find) is its name in the obsidian vault (key_by_name, as links only give the name of a note),
+    and its relative path in the markdown folder. When two files have the same name, the last one added is found by name.
+    """
+    folder_path_str = None  # Full path of the folder, that the relative paths are relative to
+    key_by_name = False
+    rel_paths = None        # File number -> path relative to the folder, in posix format
+    fullpaths = None        # File number -> full path, of the files of which it is not folder_path_str/rel_path
+    sizes = None            # File number -> size in bytes, -1 when unknown (notes that were not written, see toggles/write_md_folder)
+    mtimes = None           # File number -> modification time in nanoseconds, -1 when unknown
+    processed = None        # File number -> 1 when the note is converted, or queued to be converted
+
+    by_name = None          # File name -> file number
+    by_rel_path = None      # Relative path -> file number
+
+    def __init__(self, folder_path, key_by_name=False):
+        self.folder_path_str = str(folder_path)
+        self.key_by_name = key_by_name
+        self.rel_paths = []
+        self.fullpaths = {}
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.processed = bytearray()
+
+    def __len__(self):
+        return len(self.rel_paths)
+
+    def __contains__(self, key):
+        return self.Find(key) is not None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('by_name', None)
+        state.pop('by_rel_path', None)
+        return state
+
+    def Add(self, fullpath, rel_path_posix, size=None, mtime=None):
+        """Add a file, and return its number."""
+        n = len(self.rel_paths)
+        rel_path_posix = sys.intern(rel_path_posix)
+        self.rel_paths.append(rel_path_posix)
+        if fullpath != self.folder_path_str + os.sep + rel_path_posix.replace('/', os.sep):
+            self.fullpaths[n] = fullpath
+        self.sizes.append(-1 if size is None else size)
+        self.mtimes.append(-1 if mtime is None else mtime)
+        self.processed.append(0)
+
+        if self.by_name is not None:
+            self.by_name[self.Name(n)] = n
+        if self.by_rel_path is not None:
+            self.by_rel_path[rel_path_posix] = n
+        return n
+
+    def Find(self, key):
+        """Number of the file with the given key (file name or relative path, see key_by_name), or None."""
+        if self.key_by_name:
+            return self.FindByName(key)
+        return self.FindByRelPath(key)
+
+    def FindByName(self, name):
+        if self.by_name is None:
+            self.by_name = {sys.intern(self.Name(n)): n for n in range(len(self.rel_paths))}
+        return self.by_name.get(name, None)
+
+    def FindByRelPath(self, rel_path_posix):
+        if self.by_rel_path is None:
+            self.by_rel_path = {rel_path_posix: n for n, rel_path_posix in enumerate(self.rel_paths)}
+        return self.by_rel_path.get(rel_path_posix, None)
+
+    def Items(self):
+        """Returns the (key, file number) of every file that can be found by its key, in the order in which the keys were first added."""
+        if self.key_by_name:
+            self.FindByName(None)
+            return self.by_name.items()
+        self.FindByRelPath(None)
+        return self.by_rel_path.items()
+
+    def Fullpath(self, n):
+        fullpath = self.fullpaths.get(n, None)
+        if fullpath is None:
+            return self.folder_path_str + os.sep + self.rel_paths[n].replace('/', os.sep)
+        return fullpath
+
+    def RelPath(self, n):
+        return self.rel_paths[n]
+
+    def Name(self, n):
+        return self.rel_paths[n].rpartition('/')[2]
+
+    def IsNote(self, n):
+        return self.rel_paths[n][-3:] == '.md'
+
+    def GetVersion(self, n):
+        """(size, modification time) of the file, (None, None) when unknown."""
+        if self.sizes[n] == -1:
+            return (None, None)
+        return (self.sizes[n], self.mtimes[n])
+
+    def IsProcessed(self, n):
+        return self.processed[n] == 1
+
+    def SetProcessed(self, n):
+        self.processed[n] = 1
@@ -0,0 +1,134 @@
+import os                   #
+import re                   # regex string finding/replacing
+import time
+
+def CompileExcludeRule(line):
+    '''Compiles a .gitignore-style rule to (regex, negate, dir_only), or returns None for empty lines and comments.
+
+    - A rule that contains a / (other than at the end) is relative to the scanned folder, otherwise it matches at any depth
+    - A rule that ends with / only matches folders
+    - A rule that starts with ! includes what an earlier rule excluded (but not in a folder that was excluded as a whole)
+    - * and ? match within a path part, [abc] matches one of the characters, ** matches any number of folders
+    - A \\ matches the character that follows it literally (see EscapeExcludeRule)
+    '''
+    line = line.strip()
+    if line == '' or line[0] == '#':
+        return None
+
+    negate = (line[0] == '!')
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    anchored = ('/' in line)
+    line = line.lstrip('/')
+
+    regex = ''
+    i = 0
+    while i < len(line):
+        if line.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif line.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif line[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif line[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif line[i] == '\\' and i + 1 < len(line):
+            regex += re.escape(line[i+1])
+            i += 2
+        elif line[i] == '[' and line.find(']', i + 1) != -1:
+            end = line.find(']', i + 1)
+            characters = line[i+1:end]
+            if characters[0:1] == '!':
+                characters = '^' + characters[1:]
+            regex += '[' + characters.replace('\\', '\\\\') + ']'
+            i = end + 1
+        else:
+            regex += re.escape(line[i])
+            i += 1
+
+    if anchored == False:
+        regex = '(?:.*/)?' + regex
+    return (re.compile(regex), negate, dir_only)
+
+def EscapeExcludeRule(text):
+    '''Escapes the characters of text that have a meaning in an exclude rule, so that the rule matches text literally.'''
+    return re.sub(r'([\\\[\]*?])', r'\\\1', text)
+
+class FileScanner:
+    """Lists all files in a folder (recursively) with os.scandir(), together with their size and modification time.
+
+    Folders that are excluded are skipped as a whole, instead of listing their files first and filtering them out afterwards.
+    Rules are given in .gitignore style (see CompileExcludeRule), and are matched against paths relative to the scanned folder.
+    Like Path.rglob(), symbolic links to folders are not followed. Files are listed in the same order as Path.rglob() lists them.
+    """
+    root_path = None
+    rules = None            # Compiled exclude rules, the last rule that matches a path decides
+    verbose = False
+
+    file_count = 0          # Statistics of the last Scan()
+    excluded_count = 0
+    duration = 0
+
+    def __init__(self, root_path, exclude_rules=[], verbose=False):
+        self.root_path = root_path
+        self.rules = [rule for rule in map(CompileExcludeRule, exclude_rules) if rule is not None]
+        self.verbose = verbose
+
+    def IsExcluded(self, rel_path_posix, is_dir):
+        excluded = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and is_dir == False:
+                continue
+            if regex.fullmatch(rel_path_posix):
+                excluded = (negate == False)
+        return excluded
+
+    def Scan(self):
+        """Returns a list of {'path', 'rel_path_posix', 'size', 'mtime', 'is_symlink'} for every file, where mtime is in nanoseconds."""
+        start_time = time.perf_counter()
+        self.file_count = 0
+        self.excluded_count = 0
+
+        files = []
+        self.ScanFolder(str(self.root_path), '', files)
+
+        self.file_count = len(files)
+        self.duration = time.perf_counter() - start_time
+        return files
+
+    def ScanFolder(self, folder_path_str, rel_prefix, files):
+        subfolders = []
+        with os.scandir(folder_path_str) as entries:
+            for entry in entries:
+                rel_path_posix = rel_prefix + entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+
+                if self.IsExcluded(rel_path_posix, is_dir):
+                    self.excluded_count += 1
+                    if self.verbose:
+                        print(f'Excluded {rel_path_posix}')
+                    continue
+
+                if is_dir:
+                    if entry.is_symlink() == False:
+                        subfolders.append((entry.path, rel_path_posix + '/'))
+                    continue
+
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # Broken symbolic link
+                    continue
+                files.append({'path': entry.path, 'rel_path_posix': rel_path_posix, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'is_symlink': entry.is_symlink()})
+
+        for subfolder_path_str, subfolder_rel_prefix in subfolders:
+            self.ScanFolder(subfolder_path_str, subfolder_rel_prefix, files)
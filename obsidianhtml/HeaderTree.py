@@ -12,6 +12,10 @@ from .lib import ConvertTitleToMarkdownId
 #   header_id = ConvertTitleToMarkdownId("My Header Name")
 #   header_dict, root_element = ConvertMarkdownToHeaderTree(markdown_content_as_string)
 #   print(PrintHeaderTree(header_dict[header_id]))
+#
+# When many sections of the same markdown are needed, index it once, and get every section as a slice:
+#   index = SectionIndex(markdown_content_as_string)
+#   print(index.GetSection(header_id))
 
 def _newElement():
     return {'level': 0, 'title': '', 'md-title': '', 'content': [], 'parent': None}
@@ -90,3 +94,63 @@ def ConvertMarkdownToHeaderTree(code):
     return header_dict, root_element
 
 
+
+class SectionIndex:
+    """Index of the sections of a markdown page, built in a single scan of its lines.
+
+    A section runs from its header up to the next header of the same or a higher level (fewer #'s), so that
+    GetSection(header_id) returns exactly what PrintHeaderTree(header_dict[header_id]) would, as a slice of the text.
+    Header ids are formed like in ConvertMarkdownToHeaderTree(), duplicates get the suffix _1, _2, etc.
+    """
+    text = None             # The scanned page, with header lines written the way PrintHeaderTree() writes them
+    sections = None         # Header id -> (level, title, start, end), where text[start:end] is the section, in page order
+
+    def __init__(self, code, restore_line=None):
+        """Scans code for headers. When restore_line is given, it is applied to every line of code to get the text, 
+        e.g. to put back code sections that were stripped so that they are not mistaken for headers (see MarkdownPage.StripCodeSections)."""
+        self.sections = {}
+        lines = []
+        open_sections = []  # (header id, level) of the sections that the current line is part of, from low to high level
+        position = 0
+
+        for line in code.split('\n'):
+            # A header is a line that starts with #, where the #'s before the first space give the level
+            space = line.find(' ')
+            if len(line) >= 2 and line[0] == '#' and space != -1:
+                level = line[0:space].count('#')
+                title = line[space+1:]
+                line = level * '#' + ' ' + title
+
+                # The sections of the same or a lower level end before this line
+                while len(open_sections) > 0 and open_sections[-1][1] >= level:
+                    self.EndSection(open_sections.pop()[0], position - 1)
+
+                header_id = ConvertTitleToMarkdownId(title)
+                if header_id in self.sections.keys():
+                    i = 1
+                    while (header_id + '_' + str(i)) in self.sections.keys():
+                        i += 1
+                    header_id = header_id + '_' + str(i)
+
+                self.sections[header_id] = (level, title, position, None)
+                open_sections.append((header_id, level))
+
+            if restore_line is not None:
+                line = restore_line(line)
+            lines.append(line)
+            position += len(line) + 1
+
+        for header_id, level in open_sections:
+            self.EndSection(header_id, position - 1)
+        self.text = '\n'.join(lines)
+
+    def EndSection(self, header_id, end):
+        level, title, start, _ = self.sections[header_id]
+        self.sections[header_id] = (level, title, start, end)
+
+    def GetSection(self, header_id):
+        """Returns the section under the given header (including the header itself), or None when the page has no such header."""
+        if header_id not in self.sections.keys():
+            return None
+        level, title, start, end = self.sections[header_id]
+        return self.text[start:end]
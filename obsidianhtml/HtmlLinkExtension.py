@@ -0,0 +1,160 @@
+import urllib.parse         # convert link characters like %
+import warnings
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+
+from .MarkdownLink import MarkdownLink
+from .lib import CopyFile, NormalizePath
+
+class HtmlLinkExtension(Extension):
+    """Python-markdown extension that rewrites the links of a page while it is converted to html (see HtmlLinkTreeprocessor).
+
+    Set page_path before converting a page. The links, lookups and inputs of the page (see BuildManifest) can be read afterwards,
+    and are cleared by reset(). When page_path is None, the page is left as is.
+    """
+    obsidianhtml_config = None  # Config of obsidianhtml (Extension.config holds the options of the extension itself)
+    paths = None                # Paths of interest, such as the output and input folders
+    files = None                # FileRegistry of all files found in the markdown folder
+
+    page_path = None            # Path() object of the markdown page that is being converted
+    links = None                # Local markdown pages that the page links to
+    lookups = None              # Used to record what every file tree lookup resolved to
+    inputs = None               # Used to record which files were copied
+
+    def __init__(self, config, paths, files, **kwargs):
+        self.obsidianhtml_config = config
+        self.paths = paths
+        self.files = files
+        super().__init__(**kwargs)
+        self.reset()
+
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+
+        # Runs after the inline processor (20), which creates the <a> and <img> elements
+        md.treeprocessors.register(HtmlLinkTreeprocessor(md, self), 'obsidianhtml_links', 15)
+
+    def reset(self):
+        self.links = []
+        self.lookups = {}
+        self.inputs = []
+
+class HtmlLinkTreeprocessor(Treeprocessor):
+    """Handles the links of a page, in the order in which they appear in the page:
+    - <a href="...">: [11.1] rewrites links to local notes to .html, [12] copies linked local files over, [13] points links to not created notes to not_created.html
+    - <img src="...">: [4] copies local images over
+    Afterwards, [14] external links and [15] links to not created notes are tagged with a class, so they can be decorated differently.
+    """
+    extension = None
+
+    def __init__(self, md, extension):
+        super().__init__(md)
+        self.extension = extension
+
+    def run(self, root):
+        if self.extension.page_path is None:
+            return
+
+        for element in root.iter():
+            if element.tag == 'a' and element.get('href') is not None:
+                element.set('href', self.ConvertLink(element.get('href')))
+                self.TagLink(element)
+            elif element.tag == 'img' and element.get('src') is not None:
+                self.CopyImage(element.get('src'))
+
+    def ConvertLink(self, l):
+        """Returns the new href of the link."""
+        ext = self.extension
+        config = ext.obsidianhtml_config
+        paths = ext.paths
+        files = ext.files
+
+        # Init link
+        link = MarkdownLink(l, ext.page_path, paths['md_folder'], url_unquote=True, relative_path_md = config['toggles']['relative_path_md'], files=files)
+
+        # Don't process in the following cases
+        if link.isValid == False or link.isExternal == True or link.inRoot == False:
+            return l
+
+        # [12] Copy non md files over wholesale, then we're done for that kind of file
+        if link.suffix != '.md':
+            if link.file_number is None:
+                ext.lookups[link.rel_src_path_posix] = None
+                return l
+            # The file is copied from where the files table found it (for a symbolic link in the markdown folder: the file it points to),
+            # so that the html output does not link to a link in the markdown folder (see attachment_copy_mode)
+            src_path_str = files.Fullpath(link.file_number)
+            ext.lookups[link.rel_src_path_posix] = src_path_str
+            dst_path = paths['html_output_folder'].joinpath(link.rel_src_path)
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            CopyFile(src_path_str, dst_path)
+            ext.inputs.append(src_path_str)
+            return l
+
+        # [13] Link to a custom 404 page when linked to a not-created note
+        if link.url.split('/')[-1] == 'not_created.md':
+            return '/not_created.html'
+
+        if link.file_number is None:
+            ext.lookups[link.rel_src_path_posix] = None
+            return l
+
+        ext.lookups[link.rel_src_path_posix] = files.Fullpath(link.file_number)
+        ext.links.append(link.rel_src_path_posix)
+
+        # [11.1] Rewrite .md links to .html (when the link is to a file in our root folder)
+        query_part = ''
+        if link.query != '':
+            query_part = link.query_delimiter + link.query
+        return f'{config["html_url_prefix"]}/{link.rel_src_path_posix[:-3]}.html{query_part}'
+
+    def CopyImage(self, src):
+        """[4] Copy local images over to the output. The image link itself does not change, as the output has the same folder structure."""
+        ext = self.extension
+        paths = ext.paths
+        files = ext.files
+
+        # Image links are relative to the page, or to the root folder when they start with /
+        l = urllib.parse.unquote(src)
+        if l[0:1] == '/':
+            full_link_path = NormalizePath(paths['md_folder'].joinpath(l[1:]))
+        else:
+            full_link_path = NormalizePath(ext.page_path.parent.joinpath(l))
+
+        rel_path_posix = None
+        if full_link_path.is_relative_to(paths['md_folder']):
+            rel_path_posix = full_link_path.relative_to(paths['md_folder']).as_posix()
+
+        # Only handle local image files (images located in the root folder)
+        n = files.Find(rel_path_posix)
+        if n is None:
+            if rel_path_posix is not None:
+                ext.lookups[rel_path_posix] = None
+            if ext.obsidianhtml_config['toggles']['warn_on_skipped_image']:
+                warnings.warn(f"Image {str(full_link_path)} treated as external and not imported in html")
+            return
+        src_path_str = files.Fullpath(n)
+        ext.lookups[rel_path_posix] = src_path_str
+
+        # Copy src to dst (like [12], from the file that a symbolic link points to)
+        dst_path = paths['html_output_folder'].joinpath(rel_path_posix)
+        dst_path.parent.mkdir(parents=True, exist_ok=True)
+        CopyFile(src_path_str, dst_path)
+        ext.inputs.append(src_path_str)
+
+    def TagLink(self, element):
+        # Links that already have a class are made by extensions (e.g. footnotes), and are left alone
+        if element.get('class') is not None:
+            return
+        href = element.get('href')
+
+        # [15] Tag not created links with a class so they can be decorated differently
+        if href == '/not_created.html':
+            element.set('class', 'nonexistent-link')
+            return
+
+        # [14] Tag external links with a class so they can be decorated differently
+        # Internal links, and anchors in the page itself, are skipped
+        if href == '' or href[0] in ('/', '#'):
+            return
+        element.set('class', 'external-link')
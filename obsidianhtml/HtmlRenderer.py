@@ -0,0 +1,245 @@
+import uuid
+import time
+import html                 # escape text in tag pages
+import json
+from pathlib import Path    #
+import markdown             # convert markdown to html
+from concurrent.futures import ProcessPoolExecutor
+
+from .lib import OpenIncludedFile, SetCopyMode
+from .NetworkTree import GetShardBucket
+from .HtmlLinkExtension import HtmlLinkExtension
+from .CompiledTemplate import CompiledTemplate
+from .SearchIndex import GetSearchTokens
+from .Profiler import GetProfilerSettings, InitWorkerProfiler, GetProfiler, ProfileNote, AddNoteProfiles, Count, CountBytes
+
+# Extensions used to convert markdown to html
+markdown_extensions = ['extra', 'codehilite', 'toc', 'md_mermaid']
+# Codehilite is left at its defaults: its line numbers were never enabled (the config key used to be 'codehilite ', with a trailing
+# space), and turning them on would render every fenced code block as a table.
+markdown_extension_configs = {}
+
+class HtmlRenderer:
+    """Converts the markdown of a page to html, rewriting its links on the way (see HtmlLinkExtension), and writes it wrapped in the html template.
+
+    This is the expensive part of ConvertMarkdownPageToHtmlPage(). It only depends on the page itself and the files table,
+    so with jobs > 1 it is handed off to a pool of worker processes, each holding its own HtmlRenderer.
+    """
+    config = None
+    paths = None                # Paths of interest, such as the output and input folders
+    files = None                # FileRegistry of all files found in the markdown folder
+    html_template = None        # Built-in or user-provided html template
+    dynamic_inclusions = None   # Javascript/css includes, based on config choices
+    page_template = None        # CompiledTemplate of html_template
+    graph_template = None       # CompiledTemplate of the "Show Graph" button html, only loaded when features/build_graph is enabled
+    md = None                   # markdown.Markdown() converter, built once and reset between pages
+    link_extension = None       # HtmlLinkExtension of the converter
+
+    pool = None                 # ProcessPoolExecutor, only set when jobs > 1
+    jobs = None                 # Futures of the pages submitted to the pool
+
+    def __init__(self, config, paths, files, html_template, dynamic_inclusions):
+        self.config = config
+        self.paths = paths
+        self.files = files
+        self.html_template = html_template
+        self.dynamic_inclusions = dynamic_inclusions
+
+        self.page_template = CompiledTemplate(html_template, ['title', 'html_url_prefix', 'dynamic_includes', 'content'])
+        if self.config['toggles']['features']['build_graph']:
+            self.graph_template = CompiledTemplate(OpenIncludedFile('graph_template.html'), ['id', 'pinnedNode', 'graphUrl'])
+
+        # Setting up the extensions (e.g. pygments for codehilite) is costly, so this is only done once per process
+        self.link_extension = HtmlLinkExtension(config, paths, files)
+        self.md = markdown.Markdown(extensions=markdown_extensions + [self.link_extension], extension_configs=markdown_extension_configs)
+
+    def StartWorkers(self, jobs):
+        """Render pages in a pool of `jobs` worker processes from here on. The shared settings and the files table are sent to every worker once."""
+        self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=_InitWorker, initargs=(self.config, self.paths, self.files, self.html_template, self.dynamic_inclusions, GetProfilerSettings()))
+        self.jobs = []
+
+    def RenderPage(self, page, record):
+        """Render the page right away and return its record (see WritePage), 
+        or submit it to the worker pool when it is started, and return the Future of its record."""
+        if self.pool is not None:
+            job = self.pool.submit(_RenderPageInWorker, page, record)
+            self.jobs.append(job)
+            return job
+        with ProfileNote('html', record['src']):
+            return self.WritePage(page, record)
+
+    def RenderTagPage(self, tag, subtags, notes, dynamic_includes):
+        """Write the pages of a tag right away, or submit them to the worker pool when it is started (see WriteTagPage)."""
+        if self.pool is not None:
+            job = self.pool.submit(_WriteTagPageInWorker, tag, subtags, notes, dynamic_includes)
+            self.jobs.append(job)
+            return job
+        return self.WriteTagPage(tag, subtags, notes, dynamic_includes)
+
+    def WaitForWorkers(self):
+        """Wait until all submitted pages are written. Errors raised in a worker are raised here."""
+        if self.pool is None:
+            return
+        for job in self.jobs:
+            job.result()
+        self.StopWorkers()
+
+    def StopWorkers(self):
+        """Shut down the worker pool, if any. Pages that were submitted but not yet started are not rendered."""
+        if self.pool is None:
+            return
+        self.pool.shutdown(cancel_futures=True)
+        self.pool = None
+        self.jobs = None
+
+    def ConvertMarkdown(self, page, page_path=None):
+        """Convert markdown to html, reusing the converter of this process. 
+        The links of the page are rewritten relative to page_path, unless it is None."""
+        self.md.reset()
+        self.link_extension.page_path = page_path
+
+        # Abbreviations (extra) are registered as inline patterns named 'abbr-...' while converting a page.
+        # Older versions of python-markdown do not remove these on reset(), which would carry them over to the next page.
+        for item in list(getattr(self.md.inlinePatterns, '_priority', [])):
+            if item.name.startswith('abbr-'):
+                self.md.inlinePatterns.deregister(item.name)
+
+        if GetProfiler() is None:
+            return self.md.convert(page)
+        start = time.perf_counter()
+        html_body = self.md.convert(page)
+        Count('markdown_render_seconds', time.perf_counter() - start)
+        return html_body
+
+    def WrapInTemplate(self, html_body, dynamic_includes):
+        """Returns a full html page, with the given html as its content."""
+        return self.page_template.Render(title=self.config['site_name'], html_url_prefix=self.config['html_url_prefix'], dynamic_includes=dynamic_includes, content=html_body)
+
+    def WritePage(self, page, record):
+        """Converts the page and writes it to record['dst']. The record describes the page (key, src, dst and graph node, see ConvertMarkdownPageToHtmlPage()),
+        and is returned with the links, lookups and inputs of the page added to it."""
+        config = self.config
+        node = record['node']
+
+        # [11] Convert markdown to html
+        # [4], [11.1], [12] - [15] Links are handled while converting, see HtmlLinkExtension
+        # ------------------------------------------------------------------
+        html_body = self.ConvertMarkdown(page, Path(record['src']))
+        record['links'] = self.link_extension.links
+        record['lookups'] = self.link_extension.lookups
+        record['inputs'] = self.link_extension.inputs
+
+        # Index the text of the page for the search box while the html is at hand (see SearchIndex)
+        if config['toggles']['features']['build_search_index']:
+            record['search'] = GetSearchTokens(html_body, str(node['id']), record['tags'])
+
+        # [17] Add in graph code to template (via {content})
+        # This shows the "Show Graph" button, and adds the js code to handle showing the graph
+        # The id only has to be unique per page, and is derived from the url so that the output is reproducible.
+        if config['toggles']['features']['build_graph']:
+            graph_id = uuid.uuid5(uuid.NAMESPACE_URL, node['url']).hex
+            # Only load the neighbourhood of this note, unless the full graph is asked for (graph_neighbourhood_hops: 0)
+            if config['toggles']['features']['graph_neighbourhood_hops'] > 0:
+                graph_url = f"{config['html_url_prefix']}/98682199-5ac9-448c-afc8-23ab7359a91b-static/graph/{GetShardBucket(node['id'])}.json"
+            else:
+                graph_url = f"{config['html_url_prefix']}/98682199-5ac9-448c-afc8-23ab7359a91b-static/graph.json"
+            html_body += "\n" + self.graph_template.Render(id=graph_id, pinnedNode=node['id'], graphUrl=graph_url) + "\n"
+
+        # [16] Wrap body html in valid html structure from template
+        # ------------------------------------------------------------------
+        html = self.WrapInTemplate(html_body, self.dynamic_inclusions)
+
+        # Write html
+        with open(record['dst'], 'w', encoding="utf-8") as f:
+            f.write(html)
+        CountBytes('bytes_written', html)
+
+        return record
+
+
+    def WriteTagPage(self, tag, subtags, notes, dynamic_includes):
+        """Writes the page of a tag (None for the root of the tagtree, see TagTree) to tags/<tag>/index.html: the list of its subtags and the list of its notes.
+        The html is written directly, instead of converting markdown. When the tag has more than features/tag_page_size notes,
+        they are split over index.html, page-2.html, page-3.html, etc. The same lists are written to tags/<tag>/index.json, for client-side use."""
+        html_url_prefix = self.config['html_url_prefix']
+        page_size = self.config['toggles']['features']['tag_page_size']
+
+        folder_path = self.paths['html_output_folder'].joinpath('tags')
+        folder_url = f'{html_url_prefix}/tags/'
+        if tag is not None:
+            folder_path = folder_path.joinpath(tag)
+            folder_url += tag + '/'
+        folder_path.mkdir(parents=True, exist_ok=True)
+
+        # Subtags are listed on the first page
+        subtags_html = ''
+        if len(subtags) > 0:
+            subtags_html = '<h1 id="tags">Tags</h1>' if tag is None else '<h1 id="subtags">Subtags</h1>'
+            subtags_html += '\n<ul>\n'
+            for subtag in subtags:
+                subtag_url = f'{html_url_prefix}/tags/{subtag}/index.html'
+                subtags_html += f'<li><a href="{html.escape(subtag_url)}">{html.escape(subtag.split("/")[-1], quote=False)}</a></li>\n'
+            subtags_html += '</ul>'
+
+        page_count = 1
+        if page_size > 0 and len(notes) > page_size:
+            page_count = (len(notes) + page_size - 1) // page_size
+        page_names = ['index.html'] + [f'page-{n}.html' for n in range(2, page_count + 1)]
+
+        for n, page_name in enumerate(page_names):
+            body = []
+            if n == 0 and subtags_html != '':
+                body.append(subtags_html)
+
+            page_notes = notes
+            if page_count > 1:
+                page_notes = notes[n * page_size:(n + 1) * page_size]
+            if len(page_notes) > 0:
+                notes_html = '<h1 id="notes">Notes</h1>\n<ul>\n'
+                for note in page_notes:
+                    notes_html += f'<li><a href="{html.escape(html_url_prefix + "/" + note)}">{html.escape(note.replace(".html", ""), quote=False)}</a></li>\n'
+                notes_html += '</ul>'
+                body.append(notes_html)
+
+            if page_count > 1:
+                pager_html = '<p class="tag-pagination">'
+                if n > 0:
+                    pager_html += f'<a href="{html.escape(folder_url + page_names[n - 1])}">&laquo; Previous</a> '
+                pager_html += f'Page {n + 1} of {page_count}'
+                if n < page_count - 1:
+                    pager_html += f' <a href="{html.escape(folder_url + page_names[n + 1])}">Next &raquo;</a>'
+                pager_html += '</p>'
+                body.append(pager_html)
+
+            page_html = self.WrapInTemplate('\n'.join(body), dynamic_includes)
+            with open(folder_path.joinpath(page_name), 'w', encoding="utf-8") as f:
+                f.write(page_html)
+            CountBytes('bytes_written', page_html)
+
+        # Remove pages left over from when the tag had more notes
+        for page_path in folder_path.glob('page-*.html'):
+            if page_path.name not in page_names:
+                page_path.unlink()
+
+        index = {'tag': tag, 'subtags': subtags, 'notes': [f'{html_url_prefix}/{note}' for note in notes], 'pages': page_count}
+        with open(folder_path.joinpath('index.json'), 'w', encoding="utf-8") as f:
+            json.dump(index, f, separators=(',', ':'))
+
+
+# Worker process state
+# ------------------------------------------------------------------
+_renderer = None
+
+def _InitWorker(config, paths, files, html_template, dynamic_inclusions, profiler_settings):
+    global _renderer
+    SetCopyMode(config['attachment_copy_mode'])
+    InitWorkerProfiler(profiler_settings)
+    _renderer = HtmlRenderer(config, paths, files, html_template, dynamic_inclusions)
+
+def _RenderPageInWorker(page, record):
+    with ProfileNote('html', record['src']):
+        record = _renderer.WritePage(page, record)
+    return AddNoteProfiles(record)
+
+def _WriteTagPageInWorker(tag, subtags, notes, dynamic_includes):
+    return _renderer.WriteTagPage(tag, subtags, notes, dynamic_includes)
@@ -0,0 +1,208 @@
+import re                   # regex string finding/replacing
+import urllib.parse         # convert link characters like %
+from array import array
+from collections import deque
+from pathlib import Path    #
+
+from .lib import GetObsidianFilePath, image_suffixes
+from .MarkdownLink import MarkdownLink
+from .Profiler import Count, CountBytes
+
+# Patterns used by the pre-scan. These mirror the link formats that MarkdownPage and ConvertMarkdownPageToHtmlPage() handle,
+# but only find the links, they don't rewrite anything.
+_frontmatter_pattern = re.compile(r"\A---\n[\s\S]*?\n---\n")
+_code_pattern = re.compile(r"^```[\s\S]*?```$|`[^`\n]*`", re.MULTILINE)
+_obsidian_link_pattern = re.compile(r"(!?)\[\[([^\]]+?)\]\]|(?<=[^\[])\]\(([^)]+?)\)")
+_markdown_link_pattern = re.compile(r"(?<=\]\()([^)]+?)(?=\))")
+
+class LinkIndex:
+    """Index of the links between the notes in a folder, built once by a pre-scan of every note.
+
+    Notes are numbered in the order of the files table. Forward links, backlinks and embeds (inclusions) are stored
+    as adjacency arrays: the targets of note n are targets[offsets[n]:offsets[n+1]].
+    Links to notes that do not exist are kept per note in `unresolved`.
+    """
+    keys = None                 # Note number -> key in the files table
+    numbers = None              # Key in the files table -> note number
+
+    forward_offsets = None
+    forward_targets = None
+    reverse_offsets = None
+    reverse_targets = None
+    embed_offsets = None
+    embed_targets = None
+    unresolved = None           # Note number -> list of link targets that could not be found (only for notes that have any)
+
+    def __init__(self, keys, forward, embeds, unresolved):
+        """`forward` and `embeds` are lists (one per note) of lists of note numbers."""
+        self.keys = keys
+        self.numbers = {key: n for n, key in enumerate(keys)}
+        self.unresolved = unresolved
+
+        reverse = [[] for _ in keys]
+        for source, targets in enumerate(forward):
+            for target in targets:
+                reverse[target].append(source)
+
+        self.forward_offsets, self.forward_targets = _ToAdjacencyArrays(forward)
+        self.reverse_offsets, self.reverse_targets = _ToAdjacencyArrays(reverse)
+        self.embed_offsets, self.embed_targets = _ToAdjacencyArrays(embeds)
+
+    def Links(self, n):
+        return self.forward_targets[self.forward_offsets[n]:self.forward_offsets[n+1]]
+
+    def Backlinks(self, n):
+        return self.reverse_targets[self.reverse_offsets[n]:self.reverse_offsets[n+1]]
+
+    def Embeds(self, n):
+        return self.embed_targets[self.embed_offsets[n]:self.embed_offsets[n+1]]
+
+    def Reachable(self, start_numbers):
+        """Returns the numbers of all notes reachable from the given notes, in breadth-first order (the given notes first)."""
+        seen = bytearray(len(self.keys))
+        order = []
+        queue = deque()
+        for n in start_numbers:
+            if seen[n] == 0:
+                seen[n] = 1
+                queue.append(n)
+
+        while len(queue) > 0:
+            n = queue.popleft()
+            order.append(n)
+            for target in self.Links(n):
+                if seen[target] == 0:
+                    seen[target] = 1
+                    queue.append(target)
+        return order
+
+    def ProcessingOrder(self, entrypoint_key, process_all):
+        """Returns the keys of the notes to convert: all notes reachable from the entrypoint, followed by all other notes when process_all is set."""
+        order = []
+        if entrypoint_key in self.numbers.keys():
+            order = self.Reachable([self.numbers[entrypoint_key]])
+
+        if process_all:
+            reached = set(order)
+            order += [n for n in range(len(self.keys)) if n not in reached]
+
+        return [self.keys[n] for n in order]
+
+def _ToAdjacencyArrays(lists):
+    offsets = array('i', [0])
+    targets = array('i')
+    for l in lists:
+        targets.extend(l)
+        offsets.append(len(targets))
+    return offsets, targets
+
+def _ReadNoteForScan(path_str, texts=None):
+    text = None
+    if texts is not None:
+        text = texts.get(path_str, None)
+    if text is None:
+        with open(path_str, encoding="utf-8") as f:
+            text = f.read()
+        CountBytes('bytes_read', text)
+    text = _frontmatter_pattern.sub('', text, count=1)
+    return _code_pattern.sub('', text)
+
+def _GetCachedScan(cache, files, n, ScanNote):
+    """Returns ScanNote(fullpath) of file n, or the result of a previous scan when the note has the same size and modification time (see FileScanner)."""
+    fullpath = files.Fullpath(n)
+    if cache is None:
+        return ScanNote(fullpath)
+    version = files.GetVersion(n)
+    cached = cache.get(fullpath, None)
+    if cached is None or cached[0] != version or version == (None, None):
+        Count('link_scan_cache_misses')
+        cached = (version, ScanNote(fullpath))
+        cache[fullpath] = cached
+    else:
+        Count('link_scan_cache_hits')
+    return cached[1]
+
+def _ScanObsidianNote(path_str):
+    """Returns the (embed, target) of every link in the note that could point to a note. Targets are not resolved yet."""
+    links = []
+    for embed, wikilink, proper_link in _obsidian_link_pattern.findall(_ReadNoteForScan(path_str)):
+        if wikilink != '':
+            # Image embeds are attachments, not notes
+            if embed != '' and wikilink.split('|')[0].split('.')[-1] in image_suffixes:
+                continue
+            target = wikilink
+        else:
+            # Proper markdown links only link to notes when they have no suffix, or .md
+            target = urllib.parse.unquote(proper_link)
+            if '://' in target:
+                continue
+            if Path(target).suffix == '':
+                target += '.md'
+            if target[-3:] != '.md':
+                continue
+        links.append((embed, target))
+    return links
+
+def BuildObsidianLinkIndex(files, cache=None):
+    """Pre-scan all notes in the obsidian vault. Links are resolved by file name, like GetObsidianFilePath() does.
+    When a cache (dict) is given, the scan of a note is kept in it, and reused by the next call as long as the note is unchanged (see --watch)."""
+    notes = [(key, file_number) for key, file_number in files.Items() if files.IsNote(file_number)]
+    keys = [key for key, file_number in notes]
+    numbers = {key: n for n, key in enumerate(keys)}
+    forward = []
+    embeds = []
+    unresolved = {}
+
+    for n, (key, file_number) in enumerate(notes):
+        note_forward = []
+        note_embeds = []
+        for embed, target in _GetCachedScan(cache, files, file_number, _ScanObsidianNote):
+            filename = GetObsidianFilePath(target, files)[0]
+            if filename not in numbers.keys():
+                unresolved.setdefault(n, []).append(target)
+                continue
+
+            note_forward.append(numbers[filename])
+            if embed != '':
+                note_embeds.append(numbers[filename])
+
+        forward.append(note_forward)
+        embeds.append(note_embeds)
+
+    return LinkIndex(keys, forward, embeds, unresolved)
+
+def BuildMarkdownLinkIndex(files, md_folder_path, relative_path_md, cache=None, texts=None):
+    """Pre-scan all notes in the markdown folder. Links are resolved like ConvertMarkdownPageToHtmlPage() does, using MarkdownLink.
+    When a cache (dict) is given, the scan of a note is kept in it, and reused by the next call as long as the note is unchanged (see --watch).
+    Notes of which the text is given in `texts` (path -> text, see PicknickBasket.markdown_pages) are not read from disk."""
+    notes = [(key, file_number) for key, file_number in files.Items() if files.IsNote(file_number)]
+    keys = [key for key, file_number in notes]
+    numbers = {key: n for n, key in enumerate(keys)}
+    forward = []
+    unresolved = {}
+
+    def ScanMarkdownNote(path_str):
+        # Returns the (url, relative path or None for not_created.md) of every local link to a note
+        page_path = Path(path_str)
+        links = []
+        for l in _markdown_link_pattern.findall(_ReadNoteForScan(path_str, texts)):
+            link = MarkdownLink(l, page_path, md_folder_path, url_unquote=True, relative_path_md=relative_path_md)
+            if link.isValid == False or link.isExternal == True or link.suffix != '.md':
+                continue
+            if link.url.split('/')[-1] == 'not_created.md':
+                links.append((link.url, None))
+            else:
+                links.append((link.url, link.rel_src_path_posix))
+        return links
+
+    for n, (key, file_number) in enumerate(notes):
+        note_forward = []
+        for url, rel_src_path_posix in _GetCachedScan(cache, files, file_number, ScanMarkdownNote):
+            if rel_src_path_posix is None or rel_src_path_posix not in numbers.keys():
+                unresolved.setdefault(n, []).append(url)
+                continue
+            note_forward.append(numbers[rel_src_path_posix])
+        forward.append(note_forward)
+
+    # Inclusions are already pasted into the markdown notes at this point
+    return LinkIndex(keys, forward, [[] for _ in keys], unresolved)
@@ -4,8 +4,51 @@ import frontmatter          # remove yaml frontmatter from md files
 import urllib.parse         # convert link characters like %
 import warnings
 import shutil               # used to remove a non-empty directory, copy files
+import os                   #
+from functools import lru_cache
 from .lib import DuplicateFileNameInRoot, GetObsidianFilePath, image_suffixes
 
+# The same links are found on page after page, so parsing and resolving them is cached (see ParseUrl and ResolveUrl)
+link_cache_size = 65536
+
+@lru_cache(maxsize=link_cache_size)
+def ParseUrl(url, url_unquote=False):
+    '''Returns (url, query_delimiter, query, suffix, isValid, isExternal) of a link, see MarkdownLink.'''
+    link = MarkdownLink.__new__(MarkdownLink)
+    link.url = url
+    if url_unquote:
+        link.url = urllib.parse.unquote(link.url)
+    link.SplitQuery()
+    link.TestisValid()
+    link.ParseType()
+    link.TestIsExternal()
+    return (link.url, link.query_delimiter, link.query, link.suffix, link.isValid, link.isExternal)
+
+@lru_cache(maxsize=link_cache_size)
+def ResolveUrl(url, page_folder_path_str, root_path_str, relative_path_md):
+    '''Returns (src_path, rel_src_path, rel_src_path_posix) of a local link, see MarkdownLink.ParsePaths().
+    The path is normalized as a string, without looking at the file system (symbolic links are not followed).
+    rel_src_path and rel_src_path_posix are None when the path is outside of the root folder.'''
+    # /path/file.md --> root_path + url
+    # path/file.md --> page_path + url
+    if url[0] == '/':
+        src_path_str = os.path.join(root_path_str, url[1:])
+    elif relative_path_md:
+        src_path_str = os.path.join(page_folder_path_str, url)
+    else:
+        src_path_str = os.path.join(root_path_str, url)
+    src_path_str = os.path.normpath(os.path.abspath(src_path_str))
+
+    # Determine if relative to root
+    if src_path_str == root_path_str:
+        rel_src_path_posix = '.'
+    elif src_path_str.startswith(root_path_str.rstrip(os.sep) + os.sep):
+        rel_src_path_posix = src_path_str[len(root_path_str.rstrip(os.sep)) + 1:].replace(os.sep, '/')
+    else:
+        return (Path(src_path_str), None, None)
+
+    return (Path(src_path_str), Path(rel_src_path_posix), rel_src_path_posix)
+
 class MarkdownLink:
     """Helper class to abstract away a lot of recurring path-testing logic."""
     url = ''
@@ -20,6 +63,8 @@ class MarkdownLink:
     rel_src_path_posix = None
     page_path = None
     root_path = None
+    files = None            # FileRegistry of the root folder, optional
+    file_number = None      # Number of the linked file in files, None when it is not in there (or no files are given)
 
     query_delimiter = ''
     query = ''
@@ -27,28 +72,19 @@ class MarkdownLink:
     def __repr__(self):
         return f"MarkdownLink(\n\turl = \"{self.url}\", \n\tsuffix = '{self.suffix}', \n\tisValid = {self.isValid}, \n\tisExternal = {self.isExternal}, \n\tinRoot = {self.inRoot}, \n\tsrc_path = {self.src_path}, \n\trel_src_path = {self.rel_src_path}, \n\trel_src_path_posix = {self.rel_src_path_posix}, \n\tpage_path = {self.page_path}, \n\troot_path = {self.root_path} \n)"    
 
-    def __init__(self, url, page_path, root_path, relative_path_md = True, url_unquote=False):
+    def __init__(self, url, page_path, root_path, relative_path_md = True, url_unquote=False, files=None):
         # Set attributes
         self.relative_path_md = relative_path_md    # Whether the markdown interpreter assumes relative path when no / at the beginning of a link
         self.page_path = page_path
         self.root_path = root_path
-        self.url = url
-        if url_unquote:
-            self.url = urllib.parse.unquote(self.url)
-
-        # Split the query part of "link#query" into self.query
-        # Self.url will be the "link" part.
-        self.SplitQuery()
-
-        # Url cannot be ''
-        # If more tests are needed, they can be added here.
-        self.TestisValid()
-
-        # Get suffix, and set suffix to .md if no suffix is present
-        self.ParseType()
-
-        # Set self.isExternal if the file contains certain character sequences such as ://
-        self.TestIsExternal()
+        self.files = files
+
+        # Split the query part of "link#query" into self.query, self.url will be the "link" part (SplitQuery)
+        # Url cannot be '' (TestisValid)
+        # Get suffix, and set suffix to .md if no suffix is present (ParseType)
+        # Set self.isExternal if the file contains certain character sequences such as :// (TestIsExternal)
+        # This is done once per distinct url, see ParseUrl()
+        self.url, self.query_delimiter, self.query, self.suffix, self.isValid, self.isExternal = ParseUrl(url, url_unquote)
         
         # Set src and rel_src paths
         if self.isValid and self.isExternal == False:
@@ -91,22 +127,17 @@ class MarkdownLink:
             self.suffix = '.md'
 
     def ParsePaths(self):
-        # /path/file.md --> root_path + url
-        # path/file.md --> page_path + url
-        if self.url[0] == '/':
-            self.src_path = self.root_path.joinpath(self.url[1:]).resolve()
-        else:
-            if self.relative_path_md:
-                self.src_path = self.page_path.parent.joinpath(self.url).resolve()
-            else:
-                self.src_path = self.root_path.joinpath(self.url).resolve()
-            
+        # The page folder only matters for relative links, leaving it out of the cache key otherwise gives more cache hits (see ResolveUrl)
+        page_folder_path_str = None
+        if self.url[0] != '/' and self.relative_path_md:
+            page_folder_path_str = os.path.dirname(str(self.page_path))
+        self.src_path, self.rel_src_path, self.rel_src_path_posix = ResolveUrl(self.url, page_folder_path_str, str(self.root_path), self.relative_path_md)
+
         # Determine if relative to root
-        if self.src_path.is_relative_to(self.root_path):
-            self.inRoot = True
-        else:
+        if self.rel_src_path is None:
             return
+        self.inRoot = True
 
-        # Determine relative path
-        self.rel_src_path = self.src_path.relative_to(self.root_path)
-        self.rel_src_path_posix = self.rel_src_path.as_posix()
+        # Look up the linked file
+        if self.files is not None:
+            self.file_number = self.files.Find(self.rel_src_path_posix)
@@ -4,15 +4,50 @@ import frontmatter          # remove yaml frontmatter from md files
 import urllib.parse         # convert link characters like %
 import warnings
 import shutil               # used to remove a non-empty directory, copy files
-from .lib import DuplicateFileNameInRoot, GetObsidianFilePath, image_suffixes, ConvertTitleToMarkdownId
-from .HeaderTree import PrintHeaderTree, ConvertMarkdownToHeaderTree
+from .lib import DuplicateFileNameInRoot, GetObsidianFilePath, image_suffixes, ConvertTitleToMarkdownId, CopyFile
+from .HeaderTree import SectionIndex
+from .Profiler import Count, CountBytes
+
+# Links that are rewritten in steps [3-6] of ConvertObsidianPageToMarkdownPage():
+# ![[embed]], ![](image link) (which may contain one level of parentheses, e.g. "image (1).png"),
+# [name](proper link) (not directly following a "["), and [[obsidian link]] (possibly missing its closing "]").
+# None of them span lines, and all of them contain a "]".
+_link_pattern = re.compile(
+    r"!\[\[(?P<embed>[^\]\n]*)\]\]"
+    r"|!\[\]\((?P<image>(?:[^()\n]|\([^()\n]*\))*)\)"
+    r"|(?<!\[)\]\((?P<proper>[^)\n]+)\)"
+    r"|\[\[(?P<obsidian>[^\]\n]+)\](?P<closed>\])?"
+)
+
+# Bare http(s) links (those without the [name](link) format) that are turned into links in step [8]. Cannot start with [, (, nor "
+_bare_url_pattern = re.compile(r"(?<![\[\(\"])http.[^\s]*")
+
+# Inline tags that are removed in step [9], like #ThisIsATag: # connected to text (so no whitespace nor another #)
+_inline_tag_pattern = re.compile(r"(?<!\S)#[^\s#`]+")
+
+# Code sections that are protected from alteration by StripCodeSections(): ```codeblocks``` (spanning whole lines) and `codelines`.
+# Any \uE000 character already in the page is protected as well, so that user content never collides with the markers.
+_code_section_pattern = re.compile(r"^```[\s\S]*?```$|`.*?`|\uE000", re.MULTILINE)
+_code_section_marker_pattern = re.compile(r"\uE000(\d+)\uE001")
+
+# Notes that were converted for inclusion by this process during this run (see ResetInclusionCache):
+# fullpath -> converted MarkdownPage, of which the sections are cached as well (see GetSection)
+_inclusion_cache = {}
+
+def ResetInclusionCache():
+    '''Starts a new run: included notes are converted again on their next inclusion.'''
+    global _inclusion_cache
+    _inclusion_cache = {}
 
 class MarkdownPage:
     page = None             # Pure markdown code read from src file
     yaml = None             # Yaml is stripped from the src file and saved here
-    codeblocks = None       # used to safely store ```codeblock content
-    codelines = None        # Used to safely store `codeline` content
+    code_sections = None    # Used to safely store ```codeblock``` and `codeline` content (see StripCodeSections)
     links = None            # Used to recurse to any page linked to by this page
+    lookups = None          # Used to record what every file tree lookup resolved to (see BuildManifest)
+    inputs = None           # Used to record which other files were included or copied (see BuildManifest)
+    cycles = None           # Fullpaths of notes that were not included again in this page, as they were already being included (see [10])
+    section_index = None    # SectionIndex of the page, built on the first call to GetSection()
 
     src_path  = None        # Path() object of src file
     rel_src_path  = None    # Path() object relative to given markdown root folder (src_folder_path)
@@ -22,21 +57,27 @@ class MarkdownPage:
 
     isEntryPoint = False
 
-    file_tree = None        # Tree of files that are found in the root folder
+    file_tree = None        # FileRegistry of the files that are found in the root folder
 
-    def __init__(self, src_path, src_folder_path, file_tree):
+    def __init__(self, src_path, src_folder_path, file_tree, text=None):
         self.file_tree = file_tree
         self.src_path = src_path
         self.src_folder_path = src_folder_path
         self.rel_src_path = self.src_path.relative_to(src_folder_path)
 
         self.links = []
-        self.codeblocks = []
-        self.codelines = []
+        self.lookups = {}
+        self.inputs = []
+        self.code_sections = []
+        self.cycles = set()
         
         # Load contents of entrypoint and strip frontmatter yaml.
-        with open(src_path, encoding="utf-8") as f:
-            self.metadata, self.page = frontmatter.parse(f.read())
+        # The contents can also be given, e.g. markdown that was converted in this run, but not (yet) written to src_path
+        if text is None:
+            with open(src_path, encoding="utf-8") as f:
+                text = f.read()
+            CountBytes('bytes_read', text)
+        self.metadata, self.page = frontmatter.parse(text)
 
     def SetDestinationPath(self, dst_folder_path, entrypoint_src_path):
         """Set destination path of the converted file. Both full and relative paths are set."""
@@ -50,21 +91,24 @@ class MarkdownPage:
         self.rel_dst_path = self.dst_path.relative_to(dst_folder_path)
 
     def StripCodeSections(self):
-        """(Temporarily) Remove codeblocks/-lines so that they are not altered in all the conversions. Placeholders are inserted."""
-        self.codeblocks = re.findall("^```([\s\S]*?)```$", self.page, re.MULTILINE)
-        for i, match in enumerate(self.codeblocks):
-            self.page = self.page.replace("```"+match+"```", f'%%%codeblock-placeholder-{i}%%%')
-            
-        self.codelines = re.findall("`(.*?)`", self.page)
-        for i, match in enumerate(self.codelines):
-            self.page = self.page.replace("`"+match+"`", f'%%%codeline-placeholder-{i}%%%')
-           
+        """(Temporarily) Remove codeblocks/-lines so that they are not altered in all the conversions. 
+        The page is scanned once, and every code section is replaced by a marker "\uE000<n>\uE001", where n is its index in self.code_sections."""
+        self.code_sections = []
+
+        def StripCodeSection(match):
+            section = match.group(0)
+            if section[0:3] == '```':
+                section += '\n'
+            self.code_sections.append(section)
+            return f'\uE000{len(self.code_sections) - 1}\uE001'
+
+        self.page, n = _code_section_pattern.subn(StripCodeSection, self.page)
+        Count('regex_subs', n)
+
     def RestoreCodeSections(self):
         """Undo the action of StripCodeSections."""
-        for i, value in enumerate(self.codeblocks):
-            self.page = self.page.replace(f'%%%codeblock-placeholder-{i}%%%', f"```{value}```\n")
-        for i, value in enumerate(self.codelines):
-            self.page = self.page.replace(f'%%%codeline-placeholder-{i}%%%', f"`{value}`")  
+        self.page, n = _code_section_marker_pattern.subn(lambda match: self.code_sections[int(match.group(1))], self.page)
+        Count('regex_subs', n)
 
     def AddToTagtree(self, tagtree, url=''):
         if 'tags' not in self.metadata:
@@ -73,18 +117,22 @@ class MarkdownPage:
         if url == '':
             url = str(self.dst_path)
 
-        for tag in self.metadata['tags']:
-            ctagtree = tagtree
-            for n, subtag in enumerate(tag.split('/')):
-                if subtag not in ctagtree['subtags'].keys():
-                    ctagtree['subtags'][subtag] = {'notes': [], 'subtags': {}}
-                ctagtree = ctagtree['subtags'][subtag]
-
-                if n == (len(tag.split('/')) - 1):
-                    ctagtree['notes'].append(url)
-
-    def ConvertObsidianPageToMarkdownPage(self, dst_folder_path, entrypoint_path, include_depth=0):
-        """Full subroutine converting the Obsidian Code to proper markdown. Linked files are copied over to the destination folder."""
+        tagtree.AddNote(self.metadata['tags'], url)
+
+    def GetSection(self, header):
+        """Returns the part of the (converted) page under the given header, or None when the page has no such header.
+        The page is indexed once (see SectionIndex), code sections are stripped while indexing so that they are not mistaken for headers."""
+        if self.section_index is None:
+            page = self.page
+            self.StripCodeSections()
+            code_sections = self.code_sections
+            self.section_index = SectionIndex(self.page, lambda line: _code_section_marker_pattern.sub(lambda match: code_sections[int(match.group(1))], line))
+            self.page = page
+        return self.section_index.GetSection(ConvertTitleToMarkdownId(header))
+
+    def ConvertObsidianPageToMarkdownPage(self, dst_folder_path, entrypoint_path, inclusion_stack=()):
+        """Full subroutine converting the Obsidian Code to proper markdown. Linked files are copied over to the destination folder.
+        inclusion_stack holds the fullpaths of the notes that are including this one (see [10])."""
         # -- Load contents
         self.SetDestinationPath(dst_folder_path, entrypoint_path)
 
@@ -99,66 +147,50 @@ class MarkdownPage:
         # They will be restored at the end
         self.StripCodeSections() 
 
-        # -- [2] Add newline between paragraph and lists
-        buffer = ''
-        prev_is_list_line = False
-        for i, line in enumerate(self.page.split('\n')):
-            current_is_list_line = False
-            clean_line = line.strip()
-            if len(clean_line) == 0:
-                current_is_list_line = False
-            elif clean_line[0] == '-':
-                current_is_list_line = True
-            if current_is_list_line and (prev_is_list_line == False):
-                buffer += '\n'
-            buffer += '\n' + line
-            prev_is_list_line = current_is_list_line
-        self.page = buffer
-
-        # -- [3] Convert Obsidian type img links to proper md image links
-        # Further conversion will be done in the block below
-        for link in re.findall("(?<=\!\[\[)(.*?)(?=\])", self.page):
-            new_link = '![]('+link+')'
-
-            # Obsidian page inclusions use the same tag...
-            # Skip if we don't match image suffixes. Inclusions are handled at the end.
-            if len(link.split('.')) == 1 or link.split('.')[-1].split('|')[0] not in image_suffixes:
-                new_link = f'<inclusion href="{link}" />'
-
-            safe_link = re.escape('![['+link+']]')
-            self.page = re.sub(safe_link, new_link, self.page)
-
-        # -- [4] Handle local image links (copy them over to output)
-        for link in re.findall("(?<=\!\[\]\()(.*)(?=\))", self.page):
+        # -- [2-9] Convert the page line by line
+        # Links, bare links and tags do not span lines, and code sections are replaced by markers (see [1]), so every line
+        # is converted on its own, in a single pass over the page. The converted lines are joined once, at the end.
+
+        # -- [3-6] Rewrite links
+        # All link types are found in a single scan of a line (see _link_pattern), and rewritten as they are found:
+        # [3] Obsidian type img links ![[image.png]] are converted to proper md image links, other ![[...]] links to inclusions
+        # [4] Local image links ![](image.png) are copied over to the output and pointed to the copy
+        # [5] Proper markdown links [name](note) point to the full relative path; linked local files are copied over
+        # [6] Obsidian links [[My Note]] are converted to proper markdown links
+        rel_entrypoint_path_posix = rel_obsidian_entrypoint_path.as_posix()
+        depth_prefix = '../' * page_folder_depth
+        proper_links = []       # Links to recurse to, kept apart per link type so that they end up in self.links in the order of the steps
+        obsidian_links = []
+
+        def ConvertImageLink(link):
+            # -- [4] Handle local image links (copy them over to output)
             clean_link_name = urllib.parse.unquote(link).split('/')[-1].split('|')[0]
 
             # Only handle local image files (images located in the root folder)
-            if clean_link_name not in self.file_tree.keys():
-                continue
+            n = self.file_tree.Find(clean_link_name)
+            if n is None:
+                self.lookups[clean_link_name] = None
+                return '![]('+link+')'
 
             # Build relative paths
-            src_file_path_str = self.file_tree[clean_link_name]['fullpath']
-            relative_path = Path(src_file_path_str).relative_to(self.src_folder_path)
+            src_file_path_str = self.file_tree.Fullpath(n)
+            self.lookups[clean_link_name] = src_file_path_str
+            self.inputs.append(src_file_path_str)
+            relative_path = self.file_tree.RelPath(n)
             dst_file_path = self.dst_folder_path.joinpath(relative_path)
 
             # Create folders if necessary
             dst_file_path.parent.mkdir(parents=True, exist_ok=True)
 
             # Copy file over
-            shutil.copyfile(src_file_path_str, dst_file_path)
+            CopyFile(src_file_path_str, dst_file_path)
 
             # Adjust link in page
-            file_name = urllib.parse.unquote(link)
-            relative_path = relative_path.as_posix()
-            relative_path = ('../' * page_folder_depth) + relative_path
-            new_link = '![]('+urllib.parse.quote(relative_path)+')'
-            safe_link = re.escape('![]('+link+')')
-            self.page = re.sub(safe_link, new_link, self.page)
-
-        # -- [5] Change file name in proper markdown links to path
-        # And while we are busy, change the path to point to the full relative path
-        proper_links = re.findall("(?<=[^\[]\]\().+?(?=\))", self.page)
-        for l in proper_links:
+            return '![]('+urllib.parse.quote(depth_prefix + relative_path)+')'
+
+        def ConvertProperLink(l, rewrite):
+            # -- [5] Change file name in proper markdown links to path
+            # And while we are busy, change the path to point to the full relative path
             # Get the filename
             file_name = urllib.parse.unquote(l)
 
@@ -169,40 +201,42 @@ class MarkdownPage:
             if Path(file_name).suffix == '':
                 isMd = True
                 file_name += '.md'
-    
+
             if isMd:
                 # Add to list to recurse to the link later
-                self.links.append(file_name)
+                proper_links.append(file_name)
 
             # Don't continue processing for non local files
-            if file_name.split('/')[-1] not in self.file_tree.keys():
-                continue
+            n = self.file_tree.Find(file_name.split('/')[-1])
+            if n is None:
+                self.lookups[file_name.split('/')[-1]] = None
+                return ']('+l+')'
 
             # Determine paths
-            filepath = self.file_tree[file_name.split('/')[-1]]['fullpath']
-            relative_path_posix = Path(filepath).relative_to(self.src_folder_path).as_posix()
-            dst_filepath = self.dst_folder_path.joinpath(relative_path_posix)
+            filepath = self.file_tree.Fullpath(n)
+            self.lookups[file_name.split('/')[-1]] = filepath
+            relative_path_posix = self.file_tree.RelPath(n)
 
-            if isMd: 
-                if relative_path_posix == rel_obsidian_entrypoint_path.as_posix():   
-                    relative_path_posix = 'index.md'
+            if isMd == False:
+                # Copy file over to new location
+                dst_filepath = self.dst_folder_path.joinpath(relative_path_posix)
+                dst_filepath.parent.mkdir(parents=True, exist_ok=True)
+                CopyFile(filepath, dst_filepath)
+                self.inputs.append(filepath)
 
-            # Change the link in the markdown to link to the relative path
-            relative_path_posix = ('../' * page_folder_depth) + relative_path_posix
-            new_link = ']('+relative_path_posix+')'
+            if isMd:
+                if relative_path_posix == rel_entrypoint_path_posix:
+                    relative_path_posix = 'index.md'
 
-            safe_link = re.escape(']('+l+')')
-            self.page = re.sub(f"(?<![\[\(])({safe_link})", new_link, self.page)
+            # Links directly following a "(" are left as is
+            if rewrite == False:
+                return ']('+l+')'
 
-            if isMd == False:
-                # Copy file over to new location
-                shutil.copyfile(filepath, dst_filepath)
+            # Change the link in the markdown to link to the relative path
+            return ']('+depth_prefix+relative_path_posix+')'
 
-            
-        # -- [6] Replace Obsidian links with proper markdown
-        # This is any string in between [[ and ]], e.g. [[My Note]]
-        md_links = re.findall("(?<=\[\[).+?(?=\])", self.page)
-        for l in md_links:
+        def ConvertObsidianLink(l, closed):
+            # -- [6] Replace Obsidian links with proper markdown
             # A link in Obsidian can have the format 'filename|alias'
             # If a link does not have an alias, the link name will function as the alias.
             parts = l.split('|')
@@ -218,30 +252,34 @@ class MarkdownPage:
                 filename = parts[0]
                 hashpart = parts[1]
 
-            isMd = False
-            if filename[-3:] == '.md':
-                isMd = True
-            else:
+            if filename[-3:] != '.md':
                 # Always assume that Obsidian filenames are links
                 # This is the default behavior. Use proper markdown to link to files
                 filename += '.md'
 
-            self.links.append(filename)
+            obsidian_links.append(filename)
 
             # Links can be made in Obsidian without creating the note.
             # When we link to a nonexistant note, link to the not_created.md placeholder instead.
-            if filename not in self.file_tree.keys():
+            n = self.file_tree.Find(filename)
+            if n is None:
+                self.lookups[filename] = None
                 relative_path_posix = '/not_created.md'
             else:
                 # Obtain the full path of the file in the directory tree
                 # e.g. 'C:\Users\Installer\OneDrive\Obsidian\Notes\Work\Harbor Docs.md'
-                full_path = self.file_tree[filename]['fullpath']
-                relative_path_posix = Path(full_path).relative_to(self.src_folder_path).as_posix()
-                
-                if relative_path_posix == rel_obsidian_entrypoint_path.as_posix():    
+                full_path = self.file_tree.Fullpath(n)
+                self.lookups[filename] = full_path
+                relative_path_posix = self.file_tree.RelPath(n)
+
+                if relative_path_posix == rel_entrypoint_path_posix:
                     relative_path_posix = 'index.md'
 
-                relative_path_posix = ('../' * page_folder_depth) +  relative_path_posix
+                relative_path_posix = depth_prefix + relative_path_posix
+
+            # Obsidian links without the closing ]] are only recursed to
+            if closed is None:
+                return '[['+l+']'
 
             newlink = urllib.parse.quote(relative_path_posix)
 
@@ -250,62 +288,133 @@ class MarkdownPage:
                 newlink += f'#{hashpart}'
 
             # Replace Obsidian link with proper markdown link
-            self.page = self.page.replace('[['+l+']]', f"[{alias}]({newlink})")
+            return f"[{alias}]({newlink})"
+
+        def ConvertLink(match):
+            if match.group('embed') is not None:
+                # -- [3] Convert Obsidian type img links to proper md image links
+                # Obsidian page inclusions use the same tag...
+                # Skip if we don't match image suffixes. Inclusions are handled at the end.
+                link = match.group('embed')
+                if len(link.split('.')) == 1 or link.split('.')[-1].split('|')[0] not in image_suffixes:
+                    return f'<inclusion href="{link}" />'
+                return ConvertImageLink(link)
+            if match.group('image') is not None:
+                return ConvertImageLink(match.group('image'))
+            if match.group('proper') is not None:
+                # The start of a line follows a newline
+                rewrite = (match.start() == 0 or match.string[match.start() - 1] != '(')
+                return ConvertProperLink(match.group('proper'), rewrite)
+            return ConvertObsidianLink(match.group('obsidian'), match.group('closed'))
+
+        def ConvertBareUrl(match):
+            # -- [8] Insert markdown links for bare http(s) links
+            l = match.group(0)
+            return f"[{l}]({l})"
+
+        def ConvertInlineTag(match):
+            # -- [9] Remove inline tags, like #ThisIsATag
+            tag = match.group(0).replace('.', '').replace('#', '')
+            return f"**{tag}**"
+
+        lines = self.page.split('\n')
+        last = len(lines) - 1
+        converted_lines = ['   ']      # The page starts with a newline (see [2] and [7])
+        prev_is_list_line = False
+        subs = 0
+        for i, line in enumerate(lines):
+            # -- [2] Add newline between paragraph and lists
+            clean_line = line.strip()
+            current_is_list_line = (len(clean_line) > 0 and clean_line[0] == '-')
+            if current_is_list_line and (prev_is_list_line == False):
+                converted_lines.append('   ')
+            prev_is_list_line = current_is_list_line
 
+            # -- [3-6] Rewrite links
+            if ']' in line:
+                line, n = _link_pattern.subn(ConvertLink, line)
+                subs += n
 
-        # -- [7] Fix newline issue by adding three spaces before any newline
-        self.page = self.page.replace("\n", "   \n")
+            # -- [7] Fix newline issue by adding three spaces before any newline
+            if i != last:
+                line += '   '
 
-        # -- [8] Insert markdown links for bare http(s) links (those without the [name](link) format).
-        # Cannot start with [, (, nor "
-        for l in re.findall("(?<![\[\(\"])(http.[^\s]*)", self.page):
-            new_md_link = f"[{l}]({l})"
-            safe_link = re.escape(l)
-            self.page = re.sub(f"(?<![\[\(])({safe_link})", new_md_link, self.page)
+            # -- [8] Insert markdown links for bare http(s) links (those without the [name](link) format)
+            # Every bare link is replaced where it is found, so a link that occurs twice, or that is part of another link, is not wrapped twice
+            if 'http' in line:
+                line, n = _bare_url_pattern.subn(ConvertBareUrl, line)
+                subs += n
 
-        # -- [9] Remove inline tags, like #ThisIsATag
-        # Inline tags are # connected to text (so no whitespace nor another #)
-        for l in re.findall("(?<!\S)#[^\s#`]+", self.page):
-            tag = l.replace('.', '').replace('#', '')
-            new_md_str = f"**{tag}**"
-            safe_str = re.escape(l)
-            self.page = re.sub(safe_str, new_md_str, self.page)
+            # -- [9] Remove inline tags
+            # Like [8], a tag that is the start of another tag (#tag, #tag/subtag) does not alter the other one
+            if '#' in line:
+                line, n = _inline_tag_pattern.subn(ConvertInlineTag, line)
+                subs += n
+
+            converted_lines.append(line)
+
+        self.page = '\n'.join(converted_lines)
+        self.links += proper_links + obsidian_links
+        Count('regex_subs', subs)
 
         # -- [10] Add code inclusions
+        # An included note is converted once per run, and reused for every page (and section) that includes it.
+        # A note that is already being included (A includes B includes A) is linked to instead.
+        inclusion_stack = inclusion_stack + (str(self.src_path),)
         for l in re.findall(r'^(\<inclusion href="[^"]*" />)', self.page, re.MULTILINE):
             link = l.replace('<inclusion href="', '').replace('" />', '')
             link_lookup = GetObsidianFilePath(link, self.file_tree)
-            file_record = link_lookup[1]
+            n = link_lookup[1]
             header = link_lookup[2]
+            self.lookups[link_lookup[0]] = (self.file_tree.Fullpath(n) if n is not None else None)
 
-            if link_lookup == False:
+            if n is None:
                 self.page = self.page.replace(l, f"> **obsidian-html error:** Could not find page {link}.")
                 continue
             
-            self.links.append(file_record['fullpath'])
+            self.links.append(self.file_tree.Fullpath(n))
 
-            if include_depth > 3:
-                self.page = self.page.replace(l, f"[{link}]({file_record['fullpath']}).")
-                continue
-
-            incl_page_path = Path(file_record['fullpath']).resolve()
+            incl_page_path = Path(self.file_tree.Fullpath(n)).resolve()
             if incl_page_path.exists() == False or incl_page_path.suffix != '.md':
                 self.page = self.page.replace(l, f"> **obsidian-html error:** Error including file or not a markdown file {link}.")
                 continue
+
+            if str(incl_page_path) in inclusion_stack:
+                warnings.warn(f"Inclusion cycle: {' -> '.join(inclusion_stack)} -> {str(incl_page_path)}. Linking to the note instead.")
+                self.cycles.add(str(incl_page_path))
+                self.page = self.page.replace(l, ConvertObsidianLink(link, ']'))
+                continue
             
             # Get code
-            included_page = MarkdownPage(incl_page_path, self.src_folder_path, self.file_tree)
-            included_page.ConvertObsidianPageToMarkdownPage(self.dst_folder_path, entrypoint_path, include_depth=include_depth + 1)
+            # A cached note can only be reused when none of the notes it includes is being included here
+            included_page = _inclusion_cache.get(str(incl_page_path), None)
+            if included_page is not None and any(path_str in included_page.inputs for path_str in inclusion_stack):
+                included_page = None
+            Count('inclusion_cache_hits' if included_page is not None else 'inclusion_cache_misses')
+            if included_page is None:
+                included_page = MarkdownPage(incl_page_path, self.src_folder_path, self.file_tree)
+                included_page.ConvertObsidianPageToMarkdownPage(self.dst_folder_path, entrypoint_path, inclusion_stack)
+
+                # Notes that are part of a cycle are converted differently depending on where the cycle was entered, so they are not cached
+                included_page.cycles.discard(str(incl_page_path))
+                if len(included_page.cycles) == 0:
+                    _inclusion_cache[str(incl_page_path)] = included_page
+                self.cycles.update(included_page.cycles)
+
+            # The included page's dependencies are dependencies of this page as well
+            self.inputs.append(str(incl_page_path))
+            self.inputs += included_page.inputs
+            self.lookups.update(included_page.lookups)
 
             # Get subsection of code if header is present
             if header != '':
-                header_id = ConvertTitleToMarkdownId(header)
-                included_page.StripCodeSections()
-                header_dict, root_element = ConvertMarkdownToHeaderTree(included_page.page)
-                included_page.page = PrintHeaderTree(header_dict[header_id])
-                included_page.RestoreCodeSections()
-            
-            self.page = self.page.replace(l, included_page.page + '\n')
+                section = included_page.GetSection(header)
+                if section is None:
+                    self.page = self.page.replace(l, f"> **obsidian-html error:** Could not find header {header} in page {link}.")
+                else:
+                    self.page = self.page.replace(l, section + '\n')
+            else:
+                self.page = self.page.replace(l, included_page.page + '\n')
 
         # -- [1] Restore codeblocks/-lines
         self.RestoreCodeSections()
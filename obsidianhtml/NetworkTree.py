@@ -1,51 +1,232 @@
 import json
+import zlib
+import hashlib
+from array import array
+from collections import deque
+
+# Neighbourhood shards are spread over this many files (see WriteNeighbourhoodShards)
+shard_bucket_count = 64
+
+def GetShardBucket(node_id):
+    '''Number of the file that holds the neighbourhood shard of the given node. Only depends on the id, so that pages can link to it before the graph is complete.'''
+    return zlib.crc32(node_id.encode('utf-8')) % shard_bucket_count
 
 class NetworkTree:
+    """Graph of the converted notes, written to graph.json for the graph view.
+
+    Nodes and links are not kept as dicts, but as columns: node i is (node_ids[i], node_groups[i], node_urls[i]),
+    and link j is (link_sources[j], link_targets[j], link_values[j]), where sources and targets are node numbers.
+    The lookup tables node_numbers and link_numbers make adding a node or link O(1). Adding a link that is already
+    present increases its value (weight) instead.
+    """
     conf = None
-    tree = None
+
+    node_ids = None             # Node number -> id
+    node_groups = None
+    node_urls = None
+    node_numbers = None         # Id -> node number
+
+    link_sources = None
+    link_targets = None
+    link_values = None
+    link_numbers = None         # (source node number, target node number) -> link number
 
     def __init__(self, conf):
         self.conf = conf
-        self.tree = {'nodes': [], 'links': []}
+        self.node_ids = []
+        self.node_groups = array('i')
+        self.node_urls = []
+        self.node_numbers = {}
+
+        self.link_sources = array('i')
+        self.link_targets = array('i')
+        self.link_values = array('i')
+        self.link_numbers = {}
 
     def NewNode(self):
         return {'id': '', 'group': 1, 'url': ''}
 
     def NewLink(self):
-        return {'source': '', 'target': '', 'value': 1}        
+        return {'source': '', 'target': '', 'value': 1}
 
     def AddNode(self, node_obj):
         if self.conf['toggles']['verbose_printout']:
             print("Received node", node_obj)
         # Skip if already present
-        for node in self.tree['nodes']:
-            if node['id'] == node_obj['id']:
-                if self.conf['toggles']['verbose_printout']:
-                    print("Node already present")
-                return
-        
+        if node_obj['id'] in self.node_numbers:
+            if self.conf['toggles']['verbose_printout']:
+                print("Node already present")
+            return self.node_numbers[node_obj['id']]
+
         # Add node
-        self.tree['nodes'].append(node_obj)
+        self.node_numbers[node_obj['id']] = len(self.node_ids)
+        self.node_ids.append(node_obj['id'])
+        self.node_groups.append(node_obj['group'])
+        self.node_urls.append(node_obj['url'])
         if self.conf['toggles']['verbose_printout']:
             print("Node added")
+        return self.node_numbers[node_obj['id']]
 
     def AddLink(self, link_obj):
         if self.conf['toggles']['verbose_printout']:
             print("Received link", link_obj)
-        # Skip if already present        
-        for link in self.tree['links']:
-            if link['source'] == link_obj['source'] and link['target'] == link_obj['target']:
-                if self.conf['toggles']['verbose_printout']:
-                    print("Link already present")
-                return
+
+        # Links can only point to nodes in the graph, add nodes for unknown ids
+        source = self.node_numbers.get(link_obj['source'], None)
+        if source is None:
+            source = self.AddNode({'id': link_obj['source'], 'group': 1, 'url': ''})
+        target = self.node_numbers.get(link_obj['target'], None)
+        if target is None:
+            target = self.AddNode({'id': link_obj['target'], 'group': 1, 'url': ''})
+
+        # Increase weight if already present
+        if (source, target) in self.link_numbers:
+            self.link_values[self.link_numbers[(source, target)]] += link_obj['value']
+            if self.conf['toggles']['verbose_printout']:
+                print("Link already present")
+            return
 
         # Add link
-        self.tree['links'].append(link_obj) 
+        self.link_numbers[(source, target)] = len(self.link_sources)
+        self.link_sources.append(source)
+        self.link_targets.append(target)
+        self.link_values.append(link_obj['value'])
         if self.conf['toggles']['verbose_printout']:
             print("Link added")
-    
+
+    def IterJson(self):
+        """Yields graph.json in chunks (one per node/link), in the format {"nodes": [{"id", "group", "url"}, ...], "links": [{"source", "target", "value"}, ...]}."""
+        yield '{"nodes": ['
+        for i in range(len(self.node_ids)):
+            yield ('' if i == 0 else ', ') + json.dumps({'id': self.node_ids[i], 'group': self.node_groups[i], 'url': self.node_urls[i]})
+
+        yield '], "links": ['
+        for j in range(len(self.link_sources)):
+            link = {'source': self.node_ids[self.link_sources[j]], 'target': self.node_ids[self.link_targets[j]], 'value': self.link_values[j]}
+            yield ('' if j == 0 else ', ') + json.dumps(link)
+        yield ']}'
+
+    def WriteJson(self, f):
+        for chunk in self.IterJson():
+            f.write(chunk)
+
     def OutputJson(self):
-        return json.dumps(self.tree)
+        return ''.join(self.IterJson())
+
+    def GetNeighbourhood(self, start, hops, neighbours):
+        '''Returns the sorted node numbers that are at most `hops` links (in either direction) away from node `start`.'''
+        seen = {start}
+        queue = deque([(start, 0)])
+        while len(queue) > 0:
+            n, distance = queue.popleft()
+            if distance == hops:
+                continue
+            for neighbour in neighbours[n]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append((neighbour, distance + 1))
+        return sorted(seen)
+
+    def GetNeighbours(self):
+        '''Returns, per node number, the numbers of the nodes it links to or is linked from.'''
+        neighbours = [[] for _ in self.node_ids]
+        for j in range(len(self.link_sources)):
+            neighbours[self.link_sources[j]].append(self.link_targets[j])
+            neighbours[self.link_targets[j]].append(self.link_sources[j])
+        return neighbours
+
+    def GetChangedNodeIds(self, previous):
+        '''Returns the ids of the nodes that were added, removed or changed (group, url, or links from/to it) compared to the previous graph.'''
+        def Describe(tree):
+            nodes = {tree.node_ids[i]: (tree.node_groups[i], tree.node_urls[i]) for i in range(len(tree.node_ids))}
+            links = {}
+            for j in range(len(tree.link_sources)):
+                links[(tree.node_ids[tree.link_sources[j]], tree.node_ids[tree.link_targets[j]])] = tree.link_values[j]
+            return nodes, links
+
+        nodes, links = Describe(self)
+        previous_nodes, previous_links = Describe(previous)
+
+        changed = set()
+        for node_id in nodes.keys() | previous_nodes.keys():
+            if nodes.get(node_id, None) != previous_nodes.get(node_id, None):
+                changed.add(node_id)
+        for key in links.keys() | previous_links.keys():
+            if links.get(key, None) != previous_links.get(key, None):
+                changed.update(key)
+        return changed
+
+    def GetAffectedNodeIds(self, previous, hops):
+        '''Returns the ids of the nodes whose neighbourhood shard can differ from the one in the previous graph:
+        the nodes within `hops` links of a changed node, in either the current or the previous graph.'''
+        changed = self.GetChangedNodeIds(previous)
+        affected = set(changed)
+        for tree in (self, previous):
+            neighbours = tree.GetNeighbours()
+            for node_id in changed:
+                if node_id in tree.node_numbers:
+                    affected.update(tree.node_ids[m] for m in tree.GetNeighbourhood(tree.node_numbers[node_id], hops, neighbours))
+        return affected
+
+    def WriteNeighbourhoodShards(self, folder_path, hops, previous=None):
+        '''Writes, per node, the subgraph of the nodes within `hops` links of it, so that the graph view does not have to load the entire graph.
+
+        Shards are grouped in shard_bucket_count files: folder_path/<bucket>.json = {"notes": {node id: shard key}, "shards": {shard key: subgraph}},
+        where a subgraph has the same format as graph.json. Nodes with the same neighbourhood share a shard.
+        folder_path/index.json lists the bucket of every node.
+
+        When the graph of which the shards were written last is given as `previous`, only the buckets with a changed shard are written again.
+        '''
+        folder_path.mkdir(parents=True, exist_ok=True)
+
+        # Links in either direction, and outgoing link numbers per node
+        neighbours = self.GetNeighbours()
+        outgoing = [[] for _ in self.node_ids]
+        for j in range(len(self.link_sources)):
+            outgoing[self.link_sources[j]].append(j)
+
+        buckets = {}
+        for n, node_id in enumerate(self.node_ids):
+            buckets.setdefault(GetShardBucket(node_id), []).append(n)
+
+        rewrite = None
+        if previous is not None:
+            rewrite = set(GetShardBucket(node_id) for node_id in self.GetAffectedNodeIds(previous, hops))
+
+        # One bucket at a time, so that only the shards of one bucket are kept in memory
+        index = {'hops': hops, 'notes': {}}
+        for bucket in range(shard_bucket_count):
+            numbers = buckets.get(bucket, [])
+            for n in numbers:
+                index['notes'][self.node_ids[n]] = bucket
+            if rewrite is not None and bucket not in rewrite:
+                continue
+
+            bucket_path = folder_path.joinpath(f'{bucket}.json')
+            if len(numbers) == 0:
+                if bucket_path.exists():
+                    bucket_path.unlink()
+                continue
+
+            bucket_content = {'notes': {}, 'shards': {}}
+            for n in numbers:
+                # Sorted by id, so that a shard does not depend on the order in which the nodes were added
+                nodes = sorted(self.GetNeighbourhood(n, hops, neighbours), key=lambda m: self.node_ids[m])
+                in_shard = set(nodes)
+                links = [j for m in nodes for j in sorted(outgoing[m], key=lambda j: self.node_ids[self.link_targets[j]]) if self.link_targets[j] in in_shard]
+
+                shard = {
+                    'nodes': [{'id': self.node_ids[m], 'group': self.node_groups[m], 'url': self.node_urls[m]} for m in nodes],
+                    'links': [{'source': self.node_ids[self.link_sources[j]], 'target': self.node_ids[self.link_targets[j]], 'value': self.link_values[j]} for j in links]
+                }
+                shard_json = json.dumps(shard)
+                shard_key = hashlib.sha1(shard_json.encode('utf-8')).hexdigest()[:12]
+
+                bucket_content['notes'][self.node_ids[n]] = shard_key
+                bucket_content['shards'][shard_key] = shard
 
+            with open(bucket_path, 'w', encoding="utf-8") as f:
+                json.dump(bucket_content, f)
 
-        
\ No newline at end of file
+        with open(folder_path.joinpath('index.json'), 'w', encoding="utf-8") as f:
+            json.dump(index, f)
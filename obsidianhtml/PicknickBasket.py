@@ -1,4 +1,5 @@
 from .NetworkTree import NetworkTree
+from .TagTree import TagTree
 
 class PicknickBasket:
     files = None           
@@ -7,9 +8,19 @@ class PicknickBasket:
     paths = None
     html_template = None
     dynamic_inclusions = None
+    html_renderer = None    # HtmlRenderer, renders pages directly or in worker processes (see --jobs)
+    link_index = None       # LinkIndex of the stage that is running
+    manifest = None         # BuildManifest, only set when toggles/incremental is enabled
+    static_assets = None    # StaticAssets, the content-hashed static files
+    link_scan_cache = None  # Per stage ('md', 'html'): the link scan of every note, kept between builds in watch mode (see LinkIndex)
+    markdown_pages = None   # Path in the markdown folder -> markdown, of every note converted in this run, handed over to the html stage in memory
+    search_index = None     # SearchIndex of the converted pages, only set when features/build_search_index is enabled
+    write_md = True         # Whether the converted notes are written to the markdown folder (see toggles/write_md_folder)
 
     def __init__(self, config, paths):
         self.config = config
-        self.tagtree = {'notes': [], 'subtags': {}}
+        self.tagtree = TagTree()
         self.paths = paths
-        self.network_tree = NetworkTree(config)
\ No newline at end of file
+        self.network_tree = NetworkTree(config)
+        self.link_scan_cache = {'md': {}, 'html': {}}
+        self.markdown_pages = {}
\ No newline at end of file
@@ -0,0 +1,185 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+from pathlib import Path    #
+
+# The Profiler of this process, only set with --profile (see StartProfiler).
+# Every hook below returns right away when it is not set, so that they can stay in the hot paths.
+_profiler = None
+_no_profile = contextlib.nullcontext()
+
+def StartProfiler(report_path=None, top=10, capture_note=None):
+    '''Start profiling this process. The conversion of the note named capture_note (file name, with or without .md) is also run under cProfile and tracemalloc.'''
+    global _profiler
+    _profiler = Profiler(report_path, top, capture_note)
+    return _profiler
+
+def GetProfiler():
+    return _profiler
+
+def GetProfilerSettings():
+    '''Settings to hand to InitWorkerProfiler() in a worker process, None when not profiling.'''
+    if _profiler is None:
+        return None
+    return {'capture_note': _profiler.capture_note}
+
+def InitWorkerProfiler(settings):
+    '''Start (or stop) profiling in a worker process. Forked workers inherit the profiler of the main process, which is replaced here.'''
+    global _profiler
+    _profiler = None
+    if settings is not None:
+        StartProfiler(**settings)
+
+def WriteProfileReport():
+    if _profiler is not None:
+        _profiler.WriteReport()
+
+def Count(name, n=1):
+    '''Add n to a counter, e.g. the number of regex substitutions, or the seconds spent rendering markdown.'''
+    if _profiler is not None:
+        _profiler.counters[name] = _profiler.counters.get(name, 0) + n
+
+def CountBytes(name, data):
+    '''Add the size of data (str: utf-8 encoded, or bytes) to a counter. The string is only encoded when profiling.'''
+    if _profiler is not None:
+        Count(name, len(data.encode('utf-8')) if isinstance(data, str) else len(data))
+
+def ProfileStage(name):
+    '''End the current stage of the build, and start the next one (None to only end it).'''
+    if _profiler is not None:
+        _profiler.StartStage(name)
+
+def ProfileNote(stage, path_str):
+    '''Context manager that times the conversion of a note.'''
+    if _profiler is None:
+        return _no_profile
+    return _profiler.Note(stage, path_str)
+
+def AddNoteProfiles(result):
+    '''Hand the records of the notes profiled in this worker process back to the main process, with the result of a note (see MergeNoteProfiles).'''
+    if _profiler is not None:
+        result['profile'] = _profiler.PopNotes()
+    return result
+
+def MergeNoteProfiles(result):
+    if _profiler is not None and 'profile' in result.keys():
+        _profiler.AddNotes(result['profile'])
+
+class Profiler:
+    """Records where the time of a build goes (see --profile): wall and cpu time per stage of the build and per note,
+    and counters such as regex substitutions, bytes read/written/copied and cache hits.
+
+    Every process keeps its own Profiler. Worker processes profile the notes they convert, and send the records
+    back with the result of every note, so the counters of a worker are only counted for the notes it converts.
+    """
+    report_path = None      # Json file of the report
+    top = 10                # Number of slowest notes in the printed summary
+    capture_note = None     # Name of the note to run under cProfile and tracemalloc
+    stages = None           # Stage -> {'wall': seconds, 'cpu': seconds, 'runs': n}, in the order in which they first ran
+    notes = None            # Record of every converted note: stage, note, wall, cpu, counters and (for capture_note) capture
+    counters = None         # Name -> total
+
+    current_stage = None    # (name, wall start, cpu start) of the running stage
+    start = None            # (wall, cpu) when profiling started
+
+    def __init__(self, report_path=None, top=10, capture_note=None):
+        self.report_path = report_path
+        self.top = top
+        if capture_note is not None and capture_note.endswith('.md'):
+            capture_note = capture_note[:-3]
+        self.capture_note = capture_note
+        self.stages = {}
+        self.notes = []
+        self.counters = {}
+        self.start = (time.perf_counter(), time.process_time())
+
+    def StartStage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self.current_stage is not None:
+            stage = self.stages.setdefault(self.current_stage[0], {'wall': 0.0, 'cpu': 0.0, 'runs': 0})
+            stage['wall'] += wall - self.current_stage[1]
+            stage['cpu'] += cpu - self.current_stage[2]
+            stage['runs'] += 1
+        self.current_stage = None
+        if name is not None:
+            self.current_stage = (name, wall, cpu)
+
+    @contextlib.contextmanager
+    def Note(self, stage, path_str):
+        counters = dict(self.counters)
+        profile = None
+        if self.capture_note is not None and Path(path_str).stem == self.capture_note:
+            tracemalloc.start()
+            profile = cProfile.Profile()
+            profile.enable()
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            record = {'stage': stage, 'note': path_str, 'wall': wall, 'cpu': cpu,
+                      'counters': {name: n - counters.get(name, 0) for name, n in self.counters.items() if n != counters.get(name, 0)}}
+            if profile is not None:
+                profile.disable()
+                record['capture'] = self.GetCapture(profile)
+            self.notes.append(record)
+
+    def GetCapture(self, profile, limit=30):
+        '''The cProfile statistics (by cumulative time), and the lines that allocated the most memory, of a profiled note. Stops tracemalloc.'''
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'cprofile': stream.getvalue(),
+            'memory_peak': peak,
+            'memory_top': [str(stat) for stat in snapshot.statistics('lineno')[:limit]],
+        }
+
+    def PopNotes(self):
+        notes = self.notes
+        self.notes = []
+        return notes
+
+    def AddNotes(self, notes):
+        '''Add the note records of a worker process, and their counters to the totals.'''
+        for record in notes:
+            self.notes.append(record)
+            for name, n in record['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def GetReport(self):
+        self.StartStage(None)
+        return {
+            'total': {'wall': time.perf_counter() - self.start[0], 'cpu': time.process_time() - self.start[1]},
+            'stages': self.stages,
+            'counters': self.counters,
+            'notes': sorted(self.notes, key=lambda record: -record['wall']),
+        }
+
+    def WriteReport(self):
+        '''Write the full report to report_path as json, and print a summary: the stages, the counters and the `top` slowest notes.'''
+        report = self.GetReport()
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        print(f'> PROFILE (written to {self.report_path})')
+        print(f'{"stage":<28}{"wall (s)":>10}{"cpu (s)":>10}')
+        for name, stage in report['stages'].items():
+            print(f'{name:<28}{stage["wall"]:>10.3f}{stage["cpu"]:>10.3f}')
+        print(f'{"total":<28}{report["total"]["wall"]:>10.3f}{report["total"]["cpu"]:>10.3f}')
+        for name in sorted(report['counters'].keys()):
+            n = report['counters'][name]
+            print(f'{name:<28}{n:>20.3f}' if isinstance(n, float) else f'{name:<28}{n:>20}')
+        print('Slowest notes:')
+        for record in report['notes'][:self.top]:
+            print(f'{record["wall"]:>8.3f}s {record["stage"]:<5}{record["note"]}')
+        for record in report['notes']:
+            if 'capture' in record.keys():
+                print(f'{record["stage"]} {record["note"]}: cProfile and tracemalloc output in the report (peak memory {record["capture"]["memory_peak"]} bytes)')
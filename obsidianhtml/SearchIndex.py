@@ -0,0 +1,86 @@
+import os                   #
+import re                   # regex string finding/replacing
+import html                 # unescape html entities
+import json
+import gzip
+from collections import Counter
+
+# Tokens are runs of letters and digits, lowercased. search.js splits the search query the same way.
+_token_pattern = re.compile(r'[^\W_]+')
+_skipped_html_pattern = re.compile(r'<td class="linenos">[\s\S]*?</td>|<(script|style)\b[\s\S]*?</\1>', re.IGNORECASE)
+_tag_pattern = re.compile(r'<[^>]*>')
+
+min_token_length = 2
+max_token_length = 40
+prefix_length = 2           # Tokens are sharded by their first characters, so that a search only loads the shards of its words
+
+# Weight of a word in the title or the tags of a page, on top of the number of times it occurs in the text (which counts up to max_text_weight)
+title_weight = 20
+tag_weight = 10
+max_text_weight = 10
+
+def Tokenize(text):
+    return [token for token in _token_pattern.findall(text.lower()) if min_token_length <= len(token) <= max_token_length]
+
+def GetSearchTokens(html_body, title, tags):
+    """Returns {token: weight} of a converted page, from its html (without markup), title and tags."""
+    text = html.unescape(_tag_pattern.sub(' ', _skipped_html_pattern.sub(' ', html_body)))
+    tokens = {token: min(count, max_text_weight) for token, count in Counter(Tokenize(text)).items()}
+    for token in set(Tokenize(title)):
+        tokens[token] = tokens.get(token, 0) + title_weight
+    for token in set(Tokenize(' '.join(str(tag) for tag in tags))):
+        tokens[token] = tokens.get(token, 0) + tag_weight
+    return tokens
+
+def GetShardName(token):
+    """Name of the shard that holds the token: the hex code of its first characters (utf-8), so that any token gives a safe file name."""
+    return token[0:prefix_length].encode('utf-8').hex()
+
+class SearchIndex:
+    """Inverted index of the converted pages (token -> pages), written to the static folder for the search box of the site (see search.js).
+
+    Pages are added as they are converted (see HtmlRenderer.WritePage), and numbered in the order of their url when the index is written,
+    so that the output does not depend on the order in which the worker processes finish.
+    The index is split in gzipped json shards by token prefix (see GetShardName), and a list of all pages (docs.json.gz).
+    """
+    documents = None        # Url -> (title, {token: weight})
+
+    def __init__(self):
+        self.documents = {}
+
+    def AddDocument(self, title, url, tokens):
+        self.documents[url] = (title, tokens)
+
+    def Export(self, folder_path):
+        """Write the index to the given folder. Files that did not change are not written again, and shards that are no longer needed are removed."""
+        folder_path.mkdir(parents=True, exist_ok=True)
+
+        urls = sorted(self.documents.keys())
+        shards = {}         # Shard name -> token -> [page number, weight, page number, weight, ...], highest weights first
+        postings = {}
+        for n, url in enumerate(urls):
+            for token, weight in self.documents[url][1].items():
+                postings.setdefault(token, []).append((weight, n))
+        for token in sorted(postings.keys()):
+            shard = shards.setdefault(GetShardName(token), {})
+            shard[token] = [value for weight, n in sorted(postings[token], key=lambda posting: (-posting[0], posting[1])) for value in (n, weight)]
+
+        file_names = {'docs.json.gz'}
+        self.WriteFile(folder_path.joinpath('docs.json.gz'), [[self.documents[url][0], url] for url in urls])
+        for name, shard in shards.items():
+            file_names.add(f'{name}.json.gz')
+            self.WriteFile(folder_path.joinpath(f'{name}.json.gz'), shard)
+
+        for entry in os.scandir(folder_path):
+            if entry.name not in file_names and entry.name.endswith('.json.gz'):
+                os.unlink(entry.path)
+
+    def WriteFile(self, path, content):
+        # mtime=0 keeps the gzipped output the same for the same content
+        data = gzip.compress(json.dumps(content, separators=(',', ':'), ensure_ascii=False).encode('utf-8'), mtime=0)
+        if path.exists() and path.stat().st_size == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return
+        with open(path, 'wb') as f:
+            f.write(data)
@@ -0,0 +1,80 @@
+import os                   #
+import re                   # regex string finding/replacing
+import json
+import hashlib
+
+from .lib import OpenIncludedFileBinary
+
+# Folder in the html output that holds the static files
+static_folder_name = '98682199-5ac9-448c-afc8-23ab7359a91b-static'
+
+class StaticAssets:
+    """Static files of the package (css, js, fonts) that every page loads, exported under content-hashed names such as main.3f2a9c1b0d.css.
+
+    As the name of a file changes whenever its content does, the files can be cached indefinitely (e.g. by a CDN).
+    References to the plain names (/<static folder>/main.css) in the html template and in the css files are rewritten to the urls of the hashed names
+    (prefixed with html_url_prefix), see RewriteReferences(). Files are given in dependency order: a file can only refer to files that come before it.
+    """
+    names = None            # File name -> hashed file name
+    contents = None         # File name -> bytes, with references rewritten
+    url_prefix = ''         # html_url_prefix of the site
+
+    def __init__(self, file_names, url_prefix=''):
+        self.url_prefix = url_prefix
+        self.names = {}
+        self.contents = {}
+        for file_name in file_names:
+            content = OpenIncludedFileBinary(file_name)
+            if file_name.endswith('.css'):
+                content = self.RewriteReferences(content.decode('utf-8')).encode('utf-8')
+
+            stem, suffix = os.path.splitext(file_name)
+            self.names[file_name] = f'{stem}.{hashlib.sha1(content).hexdigest()[:10]}{suffix}'
+            self.contents[file_name] = content
+
+    def Url(self, file_name):
+        return f'{self.url_prefix}/{static_folder_name}/{self.names[file_name]}'
+
+    def RewriteReferences(self, text):
+        """Replace references to the plain names of the (so far) known files with the urls of their hashed names.
+        A template that already puts {html_url_prefix} before the reference gets the prefix only once."""
+        if len(self.names) == 0:
+            return text
+        pattern = re.compile(r'(?:\{html_url_prefix\})?' + re.escape(f'/{static_folder_name}/') + '(' + '|'.join(re.escape(file_name) for file_name in self.names) + r')(?![\w.-])')
+        return pattern.sub(lambda m: self.Url(m.group(1)), text)
+
+    def Export(self, folder_path):
+        """Write the files to the given folder, and list them in asset-manifest.json ({file name: url}).
+        A hashed file that already exists holds the same content, so only new files are written.
+        Hashed files of a previous build that are no longer used (as listed in its asset-manifest.json) are removed."""
+        folder_path.mkdir(parents=True, exist_ok=True)
+        manifest_path = folder_path.joinpath('asset-manifest.json')
+        if manifest_path.exists():
+            with open(manifest_path, encoding="utf-8") as f:
+                previous_manifest = f.read()
+        else:
+            previous_manifest = None
+
+        for file_name, hashed_name in self.names.items():
+            dst_path = folder_path.joinpath(hashed_name)
+            if dst_path.exists() and dst_path.stat().st_size == len(self.contents[file_name]):
+                continue
+            tmp_path = dst_path.with_name(f'.{hashed_name}.{os.getpid()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(self.contents[file_name])
+            os.replace(tmp_path, dst_path)
+
+        manifest = json.dumps({file_name: self.Url(file_name) for file_name in self.names}, indent=2)
+        if manifest == previous_manifest:
+            return
+
+        # Only files listed in the previous manifest are removed, the folder also holds the graph and search index files
+        if previous_manifest is not None:
+            hashed_names = set(self.names.values())
+            for url in json.loads(previous_manifest).values():
+                hashed_name = url.rsplit('/', 1)[-1]
+                if hashed_name not in hashed_names:
+                    folder_path.joinpath(hashed_name).unlink(missing_ok=True)
+
+        with open(manifest_path, 'w', encoding="utf-8") as f:
+            f.write(manifest)
@@ -0,0 +1,41 @@
+import json
+
+class TagTree:
+    """The tags of the converted notes, and the notes that have them.
+
+    Tags are nested by '/': the tag 'proj/alpha' is a subtag of 'proj'. Every tag is kept under its full path, with None
+    as the root of the tree, so adding a note or looking up a tag never walks down the tree.
+    Tags and notes are kept in the order in which they were first added.
+    """
+    notes = None            # Tag -> urls of the notes that have this tag
+    subtags = None          # Tag -> full paths of its direct subtags
+
+    def __init__(self):
+        self.notes = {None: []}
+        self.subtags = {None: []}
+
+    def AddTag(self, tag):
+        if tag in self.notes.keys():
+            return
+        parent = None
+        if '/' in tag:
+            parent = tag.rsplit('/', 1)[0]
+            self.AddTag(parent)
+        self.notes[tag] = []
+        self.subtags[tag] = []
+        self.subtags[parent].append(tag)
+
+    def AddNote(self, tags, url):
+        """Add the note with the given url to each of the given tags (and create their parent tags)."""
+        for tag in tags:
+            self.AddTag(tag)
+            self.notes[tag].append(url)
+
+    def IsUnchanged(self, tag, previous):
+        """Whether the tag has the same notes and subtags in the previous TagTree."""
+        return tag in previous.notes.keys() and previous.notes[tag] == self.notes[tag] and previous.subtags[tag] == self.subtags[tag]
+
+    def IterJson(self):
+        """Yields the tree as json chunks (one per tag), e.g. for BuildManifest.OutputChanged()."""
+        for tag, notes in self.notes.items():
+            yield json.dumps([tag, self.subtags[tag], notes]) + '\n'
@@ -0,0 +1,30 @@
+import time
+
+class Watcher:
+    """Watches a folder for changes by polling it with a FileScanner (see --watch).
+
+    Polling needs no extra dependencies and works on every platform and file system (including network drives),
+    and a scan with os.scandir() is cheap enough to repeat a few times per second, even for large vaults.
+    A file counts as changed when its size or modification time changed.
+    """
+    scanner = None
+    poll_interval = None    # Seconds between scans
+    snapshot = None         # Path relative to the folder -> (size, mtime) of every file, as of the last scan
+
+    def __init__(self, scanner, poll_interval):
+        self.scanner = scanner
+        self.poll_interval = poll_interval
+        self.snapshot = self.TakeSnapshot()
+
+    def TakeSnapshot(self):
+        return {file['rel_path_posix']: (file['size'], file['mtime']) for file in self.scanner.Scan()}
+
+    def WaitForChanges(self):
+        """Blocks until files are added, removed or changed, and returns their paths (relative to the folder)."""
+        while True:
+            time.sleep(self.poll_interval)
+            snapshot = self.TakeSnapshot()
+            changed = sorted(key for key in (snapshot.keys() | self.snapshot.keys()) if snapshot.get(key, None) != self.snapshot.get(key, None))
+            self.snapshot = snapshot
+            if len(changed) > 0:
+                return changed
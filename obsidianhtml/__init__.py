@@ -1,39 +1,124 @@
 import sys                  # commandline arguments
 import os                   #
 import shutil               # used to remove a non-empty directory, copy files
-import uuid
 import re                   # regex string finding/replacing
 from pathlib import Path    # 
-import markdown             # convert markdown to html
 import yaml
 import urllib.parse         # convert link characters like %
 import frontmatter
 import json
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
 
-from .MarkdownPage import MarkdownPage
+from .MarkdownPage import MarkdownPage, ResetInclusionCache
 from .MarkdownLink import MarkdownLink
-from .lib import DuplicateFileNameInRoot, GetObsidianFilePath, OpenIncludedFile, ExportStaticFiles, image_suffixes
+from .lib import DuplicateFileNameInRoot, GetObsidianFilePath, OpenIncludedFile, ExportStaticFiles, image_suffixes, GetConfigFingerprint, SetCopyMode
 from .PicknickBasket import PicknickBasket
+from .BuildManifest import BuildManifest
+from .HtmlRenderer import HtmlRenderer, markdown_extensions, markdown_extension_configs
+from .LinkIndex import BuildObsidianLinkIndex, BuildMarkdownLinkIndex
+from .StaticAssets import StaticAssets, static_folder_name
+from .SearchIndex import SearchIndex
+from .FileScanner import FileScanner, EscapeExcludeRule
+from .FileRegistry import FileRegistry
+from .Watcher import Watcher
+from .Profiler import CountBytes, StartProfiler, GetProfilerSettings, InitWorkerProfiler, WriteProfileReport, ProfileStage, ProfileNote, AddNoteProfiles, MergeNoteProfiles
 
 # Open source files in the package
 import importlib.resources as pkg_resources
 import importlib.util
 from . import src 
 
-def recurseObisidianToMarkdown(page_path_str, pb):
-    '''This functions converts an obsidian note to a markdown file and calls itself on any local note links it finds in the page.'''
+def ConvertObsidianNotesToMarkdown(page_path_strs, pb):
+    '''This functions converts the given obsidian notes to markdown files, and keeps going with any local note links it finds in them, until all reachable notes are converted.
+    Notes are converted in worker processes when jobs > 1. A note is handed out as soon as a link to it is found, so the workers are kept busy.'''
 
     # Unpack picknick basket so we don't have to type too much.
     paths = pb.paths        # Paths of interest, such as the output and input folders
-    files = pb.files        # Hashtable of all files found in the obsidian vault
+    files = pb.files        # FileRegistry of all files found in the obsidian vault
     config = pb.config
 
-    # Convert path string to Path and do a double check
-    page_path = Path(page_path_str).resolve()
-    if page_path.exists() == False:
-        return
-    if page_path.suffix != '.md':
-        return
+    # The files table is sent to every worker once, instead of with every note
+    pool = None
+    if config['jobs'] > 1:
+        pool = ProcessPoolExecutor(max_workers=config['jobs'], initializer=_InitObsidianWorker, initargs=(paths, files, config['attachment_copy_mode'], pb.write_md, config['toggles']['compile_html'], GetProfilerSettings()))
+
+    # The pool is also shut down when a conversion fails, so that no worker processes are left behind (e.g. in watch mode)
+    try:
+        queue = deque([(page_path_str, None) for page_path_str in page_path_strs])
+        running = set()
+        while len(queue) > 0 or len(running) > 0:
+            # Wait for a worker to finish when there is nothing left to hand out
+            # ------------------------------------------------------------------
+            if len(queue) == 0:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for job in done:
+                    result = job.result()
+                    HandleObsidianNoteResult(result, pb, queue)
+                continue
+
+            # Hand out the next note
+            # ------------------------------------------------------------------
+            page_path_str, parent_path = queue.popleft()
+
+            # Convert path string to Path and do a double check
+            page_path = Path(page_path_str).resolve()
+            if page_path.exists() == False:
+                continue
+            if page_path.suffix != '.md':
+                continue
+
+            if config['toggles']['verbose_printout'] and parent_path is not None:
+                print(f"converting {page_path} (parent {parent_path})")
+
+            # Skip conversion when neither the note nor anything it depends on changed since the previous run
+            if pb.manifest is not None:
+                rel_path_posix = page_path.relative_to(paths['obsidian_folder']).as_posix()
+                record = pb.manifest.GetUnchangedRecord('md', rel_path_posix, str(page_path), files)
+                if record is not None:
+                    if config['toggles']['verbose_printout']:
+                        print(f"unchanged {page_path}")
+                    QueueLinkedObsidianNotes(record['links'], str(page_path), files, queue)
+                    continue
+
+            # Convert the note
+            if pool is not None:
+                running.add(pool.submit(_ConvertObsidianNoteInWorker, page_path))
+                continue
+
+            with ProfileNote('md', str(page_path)):
+                result = ConvertObsidianNoteToMarkdown(page_path, paths, files, pb.write_md, config['toggles']['compile_html'])
+            HandleObsidianNoteResult(result, pb, queue)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def HandleObsidianNoteResult(result, pb, queue):
+    '''Records a converted note, hands its markdown over to the html stage, and queues the notes it links to.'''
+    MergeNoteProfiles(result)
+    if pb.manifest is not None:
+        pb.manifest.AddRecord('md', result['key'], result['src'], result['dst'], result['inputs'], result['lookups'], result['links'])
+    if 'markdown' in result.keys():
+        pb.markdown_pages[result['dst']] = result['markdown']
+    QueueLinkedObsidianNotes(result['links'], result['src'], pb.files, queue)
+
+def QueueLinkedObsidianNotes(links, parent_path_str, files, queue):
+    '''Adds every linked note that has not been processed yet to the queue.'''
+    for l in links:
+        n = GetObsidianFilePath(l, files)[1]
+        if n is None or files.IsProcessed(n):
+            continue
+
+        # Mark the file as processed so that it will not be processed again at a later stage
+        files.SetProcessed(n)
+        queue.append((files.Fullpath(n), parent_path_str))
+
+def ConvertObsidianNoteToMarkdown(page_path, paths, files, write_md=True, return_md=False):
+    '''This functions converts a single obsidian note to a markdown file. 
+    Returns the links found in the note, and its dependencies (see BuildManifest).
+    With return_md, the markdown is returned as well, so that the html stage does not have to read it back (see toggles/write_md_folder).'''
 
     # Convert note to markdown
     # ------------------------------------------------------------------
@@ -49,148 +134,151 @@ def recurseObisidianToMarkdown(page_path_str, pb):
 
     # Save file
     # ------------------------------------------------------------------
-    # Create folder if necessary
-    md.dst_path.parent.mkdir(parents=True, exist_ok=True)
+    if write_md:
+        # Create folder if necessary
+        md.dst_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write markdown to file
+        with open(md.dst_path, 'w', encoding="utf-8") as f:
+            f.write(md.page)
+        CountBytes('bytes_written', md.page)
+
+    result = {'key': md.rel_src_path.as_posix(), 'src': str(md.src_path), 'dst': str(md.dst_path), 'links': md.links, 'lookups': md.lookups, 'inputs': md.inputs}
+    if return_md:
+        result['markdown'] = md.page
+    return result
+
+# Worker process state for ConvertObsidianNotesToMarkdown()
+_obsidian_worker_paths = None
+_obsidian_worker_files = None
+_obsidian_worker_write_md = True
+_obsidian_worker_return_md = False
+
+def _InitObsidianWorker(paths, files, copy_mode, write_md, return_md, profiler_settings):
+    global _obsidian_worker_paths, _obsidian_worker_files, _obsidian_worker_write_md, _obsidian_worker_return_md
+    SetCopyMode(copy_mode)
+    InitWorkerProfiler(profiler_settings)
+    _obsidian_worker_paths = paths
+    _obsidian_worker_files = files
+    _obsidian_worker_write_md = write_md
+    _obsidian_worker_return_md = return_md
+
+def _ConvertObsidianNoteInWorker(page_path):
+    with ProfileNote('md', str(page_path)):
+        result = ConvertObsidianNoteToMarkdown(page_path, _obsidian_worker_paths, _obsidian_worker_files, _obsidian_worker_write_md, _obsidian_worker_return_md)
+    return AddNoteProfiles(result)
+
+def ConvertMarkdownPagesToHtml(page_path_strs, pb):
+    '''This functions converts the given markdown pages to html files, in the given order.
+    Pages are rendered in worker processes when jobs > 1 (see HtmlRenderer). Their dependencies are recorded as soon as they are written.
+    Afterwards, the links between them are added to the graph, from the link index.'''
+    paths = pb.paths
+    files = pb.files
+    config = pb.config
+
+    nodes = {}      # rel_path_posix -> graph node, of every converted page
+    queue = deque([(page_path_str, None) for page_path_str in page_path_strs])
+    running = set()
+    while len(queue) > 0 or len(running) > 0:
+        # Wait for a worker to finish when there is nothing left to hand out
+        # ------------------------------------------------------------------
+        if len(queue) == 0:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for job in done:
+                HandleMarkdownPageResult(job.result(), pb, queue)
+            continue
 
-    # Write markdown to file
-    with open(md.dst_path, 'w', encoding="utf-8") as f:
-        f.write(md.page)
+        # Hand out the next page
+        # ------------------------------------------------------------------
+        page_path_str, parent_path = queue.popleft()
 
-    # Recurse for every link in the current page
-    # ------------------------------------------------------------------
-    for l in md.links:
-        link = GetObsidianFilePath(l, files)
-        if link[1] == False or link[1]['processed'] == True:
+        # Convert path string to Path and do a double check
+        # Pages that were converted in this run are handed over in memory, and may not have been written to disk (see toggles/write_md_folder)
+        page_path = Path(page_path_str).resolve()
+        if str(page_path) not in pb.markdown_pages.keys() and page_path.exists() == False:
             continue
-        link_path = link[0]
+        if page_path.suffix != '.md':
+            continue
+        rel_path_posix = page_path.relative_to(paths['md_folder']).as_posix()
+
+        if config['toggles']['verbose_printout'] and parent_path is not None:
+            print("html: converting ", page_path_str, " (parent ", parent_path, ")")
+
+        # Skip conversion when neither the note nor anything it depends on changed since the previous run
+        # The graph and tagtree are fed from the record of the previous run instead.
+        if pb.manifest is not None:
+            record = pb.manifest.GetUnchangedRecord('html', rel_path_posix, str(page_path), files)
+            if record is not None:
+                if config['toggles']['verbose_printout']:
+                    print(f"html: unchanged {page_path}")
+
+                node = pb.network_tree.NewNode()
+                node.update(record['node'])
+                pb.network_tree.AddNode(node)
+                pb.tagtree.AddNote(record['tags'], record['tag_url'])
+                if pb.search_index is not None:
+                    pb.search_index.AddDocument(str(node['id']), node['url'], record['search'])
+                nodes[rel_path_posix] = node
+                QueueLinkedMarkdownPages(record['links'], str(page_path), files, queue)
+                continue
 
-        # Mark the file as processed so that it will not be processed again at a later stage
-        files[link_path]['processed'] = True         
+        # Convert the page
+        node, result = ConvertMarkdownPageToHtmlPage(page_path, pb)
+        nodes[rel_path_posix] = node
+        if isinstance(result, Future):
+            running.add(result)
+            continue
 
-        # Convert the note that is linked to
-        if config['toggles']['verbose_printout']:
-            print(f"converting {files[link_path]['fullpath']} (parent {page_path})")
+        HandleMarkdownPageResult(result, pb, queue)
 
-        recurseObisidianToMarkdown(files[link_path]['fullpath'], pb)
+    # [17] Add the links between the converted pages to the graph
+    index = pb.link_index
+    for rel_path_posix, node in nodes.items():
+        if rel_path_posix not in index.numbers.keys():
+            continue
+        n = index.numbers[rel_path_posix]
+        for target in index.Links(n):
+            target_key = index.keys[target]
+            if target == n or target_key not in nodes.keys():
+                continue
+            link = pb.network_tree.NewLink()
+            link['source'] = node['id']
+            link['target'] = nodes[target_key]['id']
+            pb.network_tree.AddLink(link)
+
+def HandleMarkdownPageResult(result, pb, queue):
+    '''Records a converted page, adds it to the search index, and queues the pages it links to.'''
+    MergeNoteProfiles(result)
+    if pb.manifest is not None:
+        pb.manifest.AddRecord('html', result['key'], result['src'], result['dst'], result['inputs'], result['lookups'], result['links'], node=result['node'], tags=result['tags'], tag_url=result['tag_url'], search=result.get('search', None))
+    if pb.search_index is not None:
+        pb.search_index.AddDocument(str(result['node']['id']), result['node']['url'], result['search'])
+    QueueLinkedMarkdownPages(result['links'], result['src'], pb.files, queue)
+
+def QueueLinkedMarkdownPages(links, parent_path_str, files, queue):
+    '''Adds every linked page that has not been processed yet to the queue. Normally the pre-scan already found all of them.'''
+    for link_path in links:
+        n = files.Find(link_path)
+        if n is None or files.IsProcessed(n) or files.IsNote(n) == False:
+            continue
+        files.SetProcessed(n)
+        queue.append((files.Fullpath(n), parent_path_str))
 
-def ConvertMarkdownPageToHtmlPage(page_path_str, pb, backlinkNode=None):
-    '''This functions converts a markdown page to an html file and calls itself on any local markdown links it finds in the page.'''
+def ConvertMarkdownPageToHtmlPage(page_path, pb):
+    '''This functions converts a markdown page to an html file, and adds it to the graph and tagtree.
+    Returns its graph node, and the record of the page (see HtmlRenderer.WritePage), or the Future of it when the page is rendered in a worker process.'''
     
     # Unpack picknick basket so we don't have to type too much.
     paths = pb.paths                    # Paths of interest, such as the output and input folders
-    files = pb.files                    # Hashtable of all files found in the obsidian vault
-    html_template = pb.html_template    # Built-in or user-provided html template
+    files = pb.files                    # FileRegistry of all files found in the markdown folder
     config = pb.config
 
-    # Convert path string to Path and do a double check
-    page_path = Path(page_path_str).resolve()
-    if page_path.exists() == False:
-        return
-    if page_path.suffix != '.md':
-        return
-
     # Load contents
     # ------------------------------------------------------------------
     # Create an object that handles a lot of the logic of parsing the page paths, content, etc
-    md = MarkdownPage(page_path, paths['md_folder'], files)
+    md = MarkdownPage(page_path, paths['md_folder'], files, pb.markdown_pages.get(str(page_path), None))
     md.SetDestinationPath(paths['html_output_folder'], paths['md_entrypoint'])
 
-    # [1] Replace code blocks with placeholders so they aren't altered
-    # They will be restored at the end
-    # ------------------------------------------------------------------
-    md.StripCodeSections()     
-
-    # Get all local markdown links. 
-    # ------------------------------------------------------------------
-    # This is any string in between '](' and  ')'
-    proper_links = re.findall("(?<=\]\().+?(?=\))", md.page)
-    for l in proper_links:
-        # Init link
-        link = MarkdownLink(l, page_path, paths['md_folder'], url_unquote=True, relative_path_md = config['toggles']['relative_path_md'])
-
-        # Don't process in the following cases
-        if link.isValid == False or link.isExternal == True: 
-            continue
-
-        # [12] Copy non md files over wholesale, then we're done for that kind of file
-        if link.suffix != '.md' and link.suffix not in image_suffixes:
-            paths['html_output_folder'].joinpath(link.rel_src_path).parent.mkdir(parents=True, exist_ok=True)
-            shutil.copyfile(link.src_path, paths['html_output_folder'].joinpath(link.rel_src_path))
-            continue
-
-        # [13] Link to a custom 404 page when linked to a not-created note
-        if link.url.split('/')[-1] == 'not_created.md':
-            new_link = '](/not_created.html)'
-        else:
-            if link.rel_src_path_posix not in files.keys():
-                continue
-
-            md.links.append(link.rel_src_path_posix)
-
-            # [11.1] Rewrite .md links to .html (when the link is to a file in our root folder)
-            query_part = ''
-            if link.query != '':
-                query_part = link.query_delimiter + link.query 
-            new_link = f']({config["html_url_prefix"]}/{link.rel_src_path_posix[:-3]}.html{query_part})'
-            
-        # Update link
-        safe_link = re.escape(']('+l+')')
-        md.page = re.sub(safe_link, new_link, md.page)
-
-    # [4] Handle local image links (copy them over to output)
-    # ------------------------------------------------------------------
-    for link in re.findall("(?<=\!\[\]\()(.*?)(?=\))", md.page):
-        l = urllib.parse.unquote(link)
-        full_link_path = page_path.parent.joinpath(l).resolve()
-        rel_path = full_link_path.relative_to(paths['md_folder'])
-
-        # Only handle local image files (images located in the root folder)
-        # Doublecheck, who knows what some weird '../../folder/..' does...
-        if rel_path.as_posix() not in files.keys():
-            if config['toggles']['warn_on_skipped_image']:
-                warnings.warn(f"Image {str(full_link_path)} treated as external and not imported in html")
-            continue
-
-        # Copy src to dst
-        dst_path = paths['html_output_folder'].joinpath(rel_path)
-        dst_path.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copyfile(full_link_path, dst_path)
-
-        # [11.2] Adjust image link in page to new dst folder (when the link is to a file in our root folder)
-        new_link = '![]('+urllib.parse.quote(rel_path.as_posix())+')'
-        safe_link = re.escape('![](/'+link+')')
-        md.page = re.sub(safe_link, new_link, md.page)
-   
-
-    # [1] Restore codeblocks/-lines
-    # ------------------------------------------------------------------
-    md.RestoreCodeSections()
-
-    # [11] Convert markdown to html
-    # ------------------------------------------------------------------
-    extension_configs = {
-    'codehilite ': {
-        'linenums': True
-    }}
-    html_body = markdown.markdown(md.page, extensions=['extra', 'codehilite', 'toc', 'md_mermaid'], extension_configs=extension_configs)
-
-    # HTML Tweaks
-    # ------------------------------------------------------------------
-    # [14] Tag external links with a class so they can be decorated differently
-    for l in re.findall(r'(?<=\<a href=")([^"]*)', html_body):
-        if l == '':
-            continue
-        if l[0] == '/':
-            # Internal link, skip
-            continue
-
-        new_str = f"<a href=\"{l}\" class=\"external-link\""
-        safe_str = f"<a href=\"{l}\""
-        html_body = html_body.replace(safe_str, new_str)
-
-    # [15] Tag not created links with a class so they can be decorated differently
-    html_body = html_body.replace('<a href="/not_created.html">', '<a href="/not_created.html" class="nonexistent-link">')
-
     # Graph view integrations
     # ------------------------------------------------------------------
     # The nodelist will result in graph.json, which may have uses beyond the graph view
@@ -199,119 +287,51 @@ def ConvertMarkdownPageToHtmlPage(page_path_str, pb, backlinkNode=None):
     node = pb.network_tree.NewNode()
     
     # Use filename as node id, unless 'graph_name' is set in the yaml frontmatter
+    # Yaml gives other types for values such as graph_name: 2021, the id is always a string
     node['id'] = str(md.rel_dst_path).split('/')[-1].replace('.md', '')
     if 'graph_name' in md.metadata.keys():
-        node['id'] = md.metadata['graph_name']
+        node['id'] = str(md.metadata['graph_name'])
 
     # Url is used so you can open the note/node by clicking on it
     node['url'] = f'{config["html_url_prefix"]}/{str(md.rel_dst_path)[:-3]}.html'
     pb.network_tree.AddNode(node)
 
-    # Backlinks are set so when recursing, the links (edges) can be determined
-    if backlinkNode is not None:
-        link = pb.network_tree.NewLink()
-        link['source'] = backlinkNode['id']
-        link['target'] = node['id']
-        pb.network_tree.AddLink(link)
-    
-    backlinkNode = node
-
-    # [17] Add in graph code to template (via {content})
-    # This shows the "Show Graph" button, and adds the js code to handle showing the graph
-    if config['toggles']['features']['build_graph']:
-        graph_template = OpenIncludedFile('graph_template.html')
-        html_body += "\n" + graph_template.replace('{id}', str(uuid.uuid4()).replace('-','')).replace('{pinnedNode}', node['id']) + "\n"
-
-    # [16] Wrap body html in valid html structure from template
-    # ------------------------------------------------------------------
-    html = html_template\
-        .replace('{title}', config['site_name'])\
-        .replace('{html_url_prefix}', config['html_url_prefix'])\
-        .replace('{dynamic_includes}', pb.dynamic_inclusions)\
-        .replace('{content}', html_body)
-
     # Save file
     # ------------------------------------------------------------------
     md.dst_path.parent.mkdir(parents=True, exist_ok=True)   
     html_dst_path_posix = md.dst_path.as_posix()[:-3] + '.html' 
 
-    md.AddToTagtree(pb.tagtree, md.dst_path.relative_to(paths['html_output_folder']).as_posix()[:-3] + '.html')
+    tag_url = md.dst_path.relative_to(paths['html_output_folder']).as_posix()[:-3] + '.html'
+    md.AddToTagtree(pb.tagtree, tag_url)
 
-    # Write html
-    with open(html_dst_path_posix, 'w', encoding="utf-8") as f:
-        f.write(html)
+    # [4], [11] - [17] Convert markdown to html, rewriting the links on the way, and write it wrapped in the html template
+    # This happens in a worker process when jobs > 1, in which case the file is written at some later point.
+    record = {'key': md.rel_src_path.as_posix(), 'src': str(md.src_path), 'dst': html_dst_path_posix, 'node': node, 'tags': md.metadata.get('tags', []), 'tag_url': tag_url}
+    result = pb.html_renderer.RenderPage(md.page, record)
 
     # > Done with this markdown page!
-
-    # Recurse for every link in the current page
-    # ------------------------------------------------------------------
-    for l in md.links:
-        # these are of type rel_path_posix
-        link_path = l
-        
-        # Skip non-existent links, non-markdown links, and links that have been processed already
-        if link_path not in files.keys():
-            continue
-        if files[link_path]['processed'] == True:
-            continue
-        if files[link_path]['fullpath'][-3:] != '.md':
-            continue        
-
-        # Mark the file as processed so that it will not be processed again at a later stage
-        files[link_path]['processed'] = True
-
-        # Convert the note that is linked to
-        if config['toggles']['verbose_printout']:
-            print("html: converting ", files[link_path]['fullpath'], " (parent ", md.src_path, ")")
-
-        ConvertMarkdownPageToHtmlPage(files[link_path]['fullpath'], pb, backlinkNode)
-
-def recurseTagList(tagtree, tagpath, pb, level):
-    '''This function creates the folder `tags` in the html_output_folder, and a filestructure in that so you can navigate the tags.'''
-
-    # Get relevant paths
-    # ---------------------------------------------------------
-    html_url_prefix = pb.config['html_url_prefix']
-    tag_dst_path = pb.paths['html_output_folder'].joinpath(f'{tagpath}index.html').resolve()
-    tag_dst_path_posix = tag_dst_path.as_posix()
-    rel_dst_path_as_posix = tag_dst_path.relative_to(pb.paths['html_output_folder']).as_posix()
-
-    # Compile markdown from tagtree
-    # ---------------------------------------------------------
-    md = ''
-    # Handle subtags
-    if len(tagtree['subtags'].keys()) > 0:
-        if level == 0:
-            md += '# Tags\n'
-        else:
-            md += '# Subtags\n'
-
-        for key in tagtree['subtags'].keys():
-            # Point of recursion
-            rel_key_path_as_posix = recurseTagList(tagtree['subtags'][key], tagpath + key + '/', pb, level+1)
-            md += f'- [{key}](/{rel_key_path_as_posix})' + '\n'
-
-    # Handle notes
-    if len(tagtree['notes']) > 0:
-        md += '\n# Notes\n'
-        for note in tagtree['notes']:
-            md += f'- [{note.replace(".html", "")}]({html_url_prefix}/{note})\n'
-
-    # Compile html
-    html_body = markdown.markdown(md, extensions=['extra', 'codehilite', 'toc', 'md_mermaid'])
-
-    html = pb.html_template.replace('{title}', pb.config['site_name'])\
-        .replace('{html_url_prefix}', pb.config['html_url_prefix'])\
-        .replace('{dynamic_includes}', '<link rel="stylesheet" href="/98682199-5ac9-448c-afc8-23ab7359a91b-static/taglist.css" />')\
-        .replace('{content}', html_body)
-
-    # Write file
-    tag_dst_path.parent.mkdir(parents=True, exist_ok=True)   
-    with open(tag_dst_path_posix, 'w', encoding="utf-8") as f:
-        f.write(html) 
-
-    # Return link of this page, to be used by caller for building its page
-    return rel_dst_path_as_posix
+    return node, result
+
+def WriteTagPages(pb, previous_tagtree=None):
+    '''This function creates the folder `tags` in the html_output_folder, with a page per tag so you can navigate the tags (see HtmlRenderer.WriteTagPage).
+    The pages are written by the worker processes when jobs > 1.
+    When the tagtree of which the pages were written last is given, only the pages of tags with changed subtags or notes are written again,
+    and the pages of tags that are gone are removed.'''
+    tagtree = pb.tagtree
+    tags_folder_path = pb.paths['html_output_folder'].joinpath('tags')
+    dynamic_includes = f'<link rel="stylesheet" href="{pb.static_assets.Url("taglist.css")}" />'
+
+    if previous_tagtree is not None:
+        for tag in previous_tagtree.notes.keys():
+            if tag is not None and tag not in tagtree.notes.keys() and tags_folder_path.joinpath(tag).exists():
+                shutil.rmtree(tags_folder_path.joinpath(tag))
+
+    for tag in tagtree.notes.keys():
+        if previous_tagtree is not None and tagtree.IsUnchanged(tag, previous_tagtree):
+            tag_folder_path = tags_folder_path if tag is None else tags_folder_path.joinpath(tag)
+            if tag_folder_path.joinpath('index.html').exists():
+                continue
+        pb.html_renderer.RenderTagPage(tag, tagtree.subtags[tag], tagtree.notes[tag], dynamic_includes)
 
 
 def main():
@@ -321,6 +341,9 @@ def main():
         print('[Obsidian-html]')
         print('- Add -i </path/to/input.yml> to provide config')
         print('- Add -v for verbose output')
+        print('- Add --jobs <n> to convert notes using n processes')
+        print('- Add --watch to keep running, and convert changed notes whenever the vault changes')
+        print('- Add --profile to report the time spent per stage and per note (see --profile-report, --profile-top, --profile-note)')
         print('- Add -h to get helptext')
         print('- Add -eht <target/path/file.name> to export the html template.')
         exit()
@@ -357,9 +380,33 @@ def main():
         conf = yaml.load(f.read(), Loader=yaml.SafeLoader) 
 
     # Overwrite conf
+    watch = False
+    profile = {}
     for i, v in enumerate(sys.argv):
         if v == '-v':
             conf['toggles']['verbose_printout'] = True
+        if v == '--watch':
+            watch = True
+        if v == '--jobs':
+            if len(sys.argv) < (i + 2):
+                raise Exception("No number of jobs given.\n Use obsidianhtml -i /path/to/config.yml --jobs 8 to provide input.")
+            conf['jobs'] = int(sys.argv[i+1])
+        if v == '--profile':
+            profile.setdefault('report_path', 'obsidianhtml-profile.json')
+        if v in ('--profile-report', '--profile-top', '--profile-note'):
+            if len(sys.argv) < (i + 2):
+                raise Exception(f"No value given for {v}.\n Use obsidianhtml -i /path/to/config.yml --profile {v} <value> to provide input.")
+            profile['report_path'] = profile.get('report_path', 'obsidianhtml-profile.json')
+            if v == '--profile-report':
+                profile['report_path'] = sys.argv[i+1]
+            if v == '--profile-top':
+                profile['top'] = int(sys.argv[i+1])
+            if v == '--profile-note':
+                profile['capture_note'] = sys.argv[i+1]
+
+    # Record where the time goes (see Profiler). The report is written after every build.
+    if len(profile) > 0:
+        StartProfiler(**profile)
 
     # Set defaults
     set_build_graph = False 
@@ -371,9 +418,32 @@ def main():
             set_build_graph = True
     if 'process_all' not in conf['toggles']:
         conf['toggles']['process_all'] = False
+    if 'incremental' not in conf['toggles']:
+        conf['toggles']['incremental'] = False
+    if 'write_md_folder' not in conf['toggles']:
+        conf['toggles']['write_md_folder'] = True
+    if 'jobs' not in conf:
+        conf['jobs'] = 1
+    if 'attachment_copy_mode' not in conf:
+        conf['attachment_copy_mode'] = 'copy'
+    if 'watch_poll_interval' not in conf:
+        conf['watch_poll_interval'] = 0.25
+
+    # Watch mode only converts what changed, which relies on the manifest of incremental builds
+    if watch:
+        conf['toggles']['incremental'] = True
 
     if set_build_graph:
         conf['toggles']['features']['build_graph'] = True
+    if 'graph_neighbourhood_hops' not in conf['toggles']['features']:
+        conf['toggles']['features']['graph_neighbourhood_hops'] = 1
+    if 'tag_page_size' not in conf['toggles']['features']:
+        conf['toggles']['features']['tag_page_size'] = 500
+    if 'build_search_index' not in conf['toggles']['features']:
+        conf['toggles']['features']['build_search_index'] = True
+
+    # Start keeping track of the files that are copied to the output (raises on an unknown mode)
+    SetCopyMode(conf['attachment_copy_mode'])
 
 
     # Set Paths
@@ -391,18 +461,33 @@ def main():
     paths['rel_md_entrypoint_path']  = paths['md_entrypoint'].relative_to(paths['md_folder'])
 
 
+    # Static files
+    # ---------------------------------------------------------
+    # These are exported under content-hashed names (see StaticAssets), in dependency order: main.css refers to the font and external.svg
+    static_file_names = ['SourceCodePro-Regular.ttf', 'external.svg', 'mermaid.min.js', 'mermaid.css', 'taglist.css', 'main.css']
+    if conf['toggles']['features']['build_graph']:
+        static_file_names.append('graph.css')
+    if conf['toggles']['features']['build_search_index']:
+        static_file_names += ['search.css', 'search.js']
+    static_assets = StaticAssets(static_file_names, conf['html_url_prefix'])
+
+
     # Compile dynamic inclusion list
     # ---------------------------------------------------------
     # This is a set of javascript/css files to be loaded into the header based on config choices.
     dynamic_inclusions = ""
     if conf['toggles']['features']['build_graph']:
-        dynamic_inclusions += '<link rel="stylesheet" href="/98682199-5ac9-448c-afc8-23ab7359a91b-static/graph.css" />' + "\n"
+        dynamic_inclusions += f'<link rel="stylesheet" href="{static_assets.Url("graph.css")}" />' + "\n"
         dynamic_inclusions += '<script src="https://d3js.org/d3.v4.min.js"></script>' + "\n"
+    if conf['toggles']['features']['build_search_index']:
+        dynamic_inclusions += f'<link rel="stylesheet" href="{static_assets.Url("search.css")}" />' + "\n"
+        dynamic_inclusions += f'<script src="{static_assets.Url("search.js")}" defer></script>' + "\n"
 
 
     # Remove previous output
     # ---------------------------------------------------------
-    if conf['toggles']['no_clean'] == False:
+    # Incremental builds depend on the previous output, and remove stale output themselves
+    if conf['toggles']['no_clean'] == False and conf['toggles']['incremental'] == False:
         print('> CLEARING OUTPUT FOLDERS')
         if conf['toggles']['compile_md']:
             if paths['md_folder'].exists():
@@ -417,9 +502,52 @@ def main():
     paths['md_folder'].mkdir(parents=True, exist_ok=True)
     paths['html_output_folder'].mkdir(parents=True, exist_ok=True)
 
+    # Convert notes
+    # ---------------------------------------------------------
+    # In watch mode, the vault is watched from before the first build, so that no change is missed
+    watcher = None
+    if watch:
+        if conf['toggles']['compile_md']:
+            watcher = Watcher(FileScanner(paths['obsidian_folder'], GetExcludeRules(conf)), conf['watch_poll_interval'])
+        else:
+            watcher = Watcher(FileScanner(paths['md_folder']), conf['watch_poll_interval'])
+
+    pb = Build(conf, paths, static_assets, dynamic_inclusions)
+    WriteProfileReport()
+
+    if watcher is not None:
+        WatchAndRebuild(watcher, conf, paths, static_assets, dynamic_inclusions, pb)
+
+def GetExcludeRules(conf):
+    '''Exclude rules for the vault scan (see FileScanner): every exclude_subfolders entry becomes a rule for that folder, followed by exclude_rules.
+    Folder names are taken literally, so a folder named e.g. "[draft]" or "notes*" only excludes itself.'''
+    exclude_rules = ['/' + EscapeExcludeRule(folder.strip('/')) + '/' for folder in conf.get('exclude_subfolders', None) or []]
+    exclude_rules += conf.get('exclude_rules', None) or []
+    return exclude_rules
+
+def Build(conf, paths, static_assets, dynamic_inclusions, previous_pb=None, save_manifest=True):
+    '''Converts the notes to markdown and/or html, and writes the extra files of the site. Returns the PicknickBasket of the build.
+    When the PicknickBasket of the previous build in this process is given (see --watch), its state is reused:
+    see BuildManifest.Restart(), and the graph shards and tag pages are only patched.'''
     # Make "global" object that we can pass to functions
     # ---------------------------------------------------------
     pb = PicknickBasket(conf, paths)
+    pb.static_assets = static_assets
+
+    # Files copied and notes converted for inclusion are only reused within a run, a rebuild (see --watch) starts over
+    SetCopyMode(conf['attachment_copy_mode'])
+    ResetInclusionCache()
+
+    # Load the manifest of the previous run, so that unchanged notes can be skipped
+    # In watch mode, the manifest and the link scans of the previous build are kept in memory
+    if previous_pb is not None:
+        pb.link_scan_cache = previous_pb.link_scan_cache
+    if conf['toggles']['incremental']:
+        if previous_pb is not None and previous_pb.manifest is not None:
+            pb.manifest = previous_pb.manifest
+            pb.manifest.Restart()
+        else:
+            pb.manifest = BuildManifest(paths['html_output_folder'].joinpath('.obsidianhtml-manifest.json'))
 
     # Convert Obsidian to markdown
     # ---------------------------------------------------------
@@ -428,60 +556,61 @@ def main():
         # Load all filenames in the root folder.
         # This data will be used to check which files are local, and to get their full path
         # It's clear that no two files can be allowed to have the same file name.
-        files = {}
-        for path in paths['obsidian_folder'].rglob('*'):
-            if path.is_dir():
-                continue
-
-            # Exclude configured subfolders
-            if 'exclude_subfolders' in conf:
-                _continue = False
-                for folder in conf['exclude_subfolders']:
-                    excl_folder_path = paths['obsidian_folder'].joinpath(folder)
-                    if path.resolve().is_relative_to(excl_folder_path):
-                        if conf['toggles']['verbose_printout']:
-                            print(f'Excluded folder {excl_folder_path}: Excluded file {path.name}.')
-                        _continue = True
-                    continue
-                if _continue:
-                    continue
-
+        ProfileStage('md: scan')
+        files = FileRegistry(paths['obsidian_folder'], key_by_name=True)
+        scanner = FileScanner(paths['obsidian_folder'], GetExcludeRules(conf), verbose=conf['toggles']['verbose_printout'])
+        for file in scanner.Scan():
             # Check if filename is duplicate
-            if path.name in files.keys() and conf['toggles']['allow_duplicate_filenames_in_root'] == False:
-                print(path)
-                raise DuplicateFileNameInRoot(f"Two or more files with the name \"{path.name}\" exist in the root folder. See {str(path)} and {files[path.name]['fullpath']}.")
+            name = file['rel_path_posix'].split('/')[-1]
+            if name in files and conf['toggles']['allow_duplicate_filenames_in_root'] == False:
+                print(file['path'])
+                raise DuplicateFileNameInRoot(f"Two or more files with the name \"{name}\" exist in the root folder. See {file['path']} and {files.Fullpath(files.Find(name))}.")
 
             # Add to tree
-            files[path.name] = {'fullpath': str(path), 'processed': False}  
+            files.Add(file['path'], file['rel_path_posix'], file['size'], file['mtime'])
+        print(f'> SCANNED {str(paths["obsidian_folder"])}: {scanner.file_count} files, {scanner.excluded_count} excluded, {scanner.duration:.2f}s')
 
         pb.files = files
 
-        # Start conversion with entrypoint.
-        # Note: this will mean that any note not (indirectly) linked by the entrypoint will not be included in the output!
+        # The converted notes are handed over to the html stage in memory, so writing them to the markdown folder can be skipped.
+        # Incremental builds compare against the markdown of the previous run, so they always write it.
+        pb.write_md = conf['toggles']['write_md_folder'] or conf['toggles']['incremental'] or conf['toggles']['compile_html'] == False
+
+        if pb.manifest is not None:
+            pb.manifest.StartStage('md', GetConfigFingerprint(conf))
+
         print(f'> COMPILING MARKDOWN FROM OBSIDIAN CODE ({str(paths["obsidian_entrypoint"])})')
-        recurseObisidianToMarkdown(str(paths['obsidian_entrypoint']), pb)
-
-        # Keep going until all other files are processed
-        if conf['toggles']['process_all'] == True:
-            unparsed = {}
-            for k in files.keys():
-                if files[k]["processed"] == False:
-                    unparsed[k] = files[k]
-
-            i = 0
-            l = len(unparsed.keys())
-            for k in unparsed.keys():
-                i += 1
-                if conf['toggles']['verbose_printout'] == True:
-                    print(f'{i}/{l}')
-                recurseObisidianToMarkdown(unparsed[k]['fullpath'], pb)
 
+        # Pre-scan all notes for links, so that the notes to convert are known up front
+        # Note: without process_all, any note not (indirectly) linked by the entrypoint will not be included in the output!
+        ProfileStage('md: link index')
+        pb.link_index = BuildObsidianLinkIndex(files, pb.link_scan_cache['md'])
+        entrypoint_key = GetObsidianFilePath(paths['obsidian_entrypoint'].name, files)[0]
+
+        page_path_strs = []
+        if entrypoint_key not in pb.link_index.numbers.keys():
+            page_path_strs.append(str(paths['obsidian_entrypoint']))
+        for k in pb.link_index.ProcessingOrder(entrypoint_key, conf['toggles']['process_all']):
+            # Mark the file as processed so that it will not be processed again at a later stage
+            n = files.Find(k)
+            files.SetProcessed(n)
+            page_path_strs.append(files.Fullpath(n))
+
+        ProfileStage('md: convert')
+        ConvertObsidianNotesToMarkdown(page_path_strs, pb)
+
+        # Remove markdown of notes that were deleted or are no longer reachable,
+        # so that the html stage does not pick them up
+        if pb.manifest is not None:
+            ProfileStage('md: remove stale output')
+            pb.manifest.RemoveStaleOutputs('md', paths['md_folder'])
         
 
     # Convert Markdown to Html
     # ------------------------------------------
     if conf['toggles']['compile_html']:
         print(f'> COMPILING HTML FROM MARKDOWN CODE ({str(paths["md_entrypoint"])})')
+        ProfileStage('html: scan')
 
         # Get html template code. 
         # Every note will become a html page, where the body comes from the note's markdown, 
@@ -497,47 +626,140 @@ def main():
             raise Exception('The provided html template does not contain the string `{content}`. This will break its intended use as a template.')
             exit(1)
 
+        # Point the template to the content-hashed static files
+        html_template = pb.static_assets.RewriteReferences(html_template)
+
         # Load all filenames in the markdown folder
         # This data is used to check which links are local
-        files = {}
-        for path in paths['md_folder'].rglob('*'):
-            if path.is_dir():
-                continue
-            rel_path_posix = path.relative_to(paths['md_folder']).as_posix()
-            files[rel_path_posix] = {'fullpath': str(path.resolve()), 'processed': False}  
+        files = FileRegistry(paths['md_folder'])
+        scanner = FileScanner(paths['md_folder'], verbose=conf['toggles']['verbose_printout'])
+        for file in scanner.Scan():
+            # Symbolic links (see attachment_copy_mode) are recorded with the path of the file they point to
+            fullpath = file['path']
+            if file['is_symlink']:
+                fullpath = os.path.realpath(fullpath)
+            files.Add(fullpath, file['rel_path_posix'], file['size'], file['mtime'])
+        print(f'> SCANNED {str(paths["md_folder"])}: {scanner.file_count} files, {scanner.duration:.2f}s')
+
+        # Add the notes that were converted in this run, but not written to the markdown folder
+        for page_path_str in pb.markdown_pages.keys():
+            rel_path_posix = Path(page_path_str).relative_to(paths['md_folder']).as_posix()
+            if rel_path_posix not in files:
+                files.Add(page_path_str, rel_path_posix)
 
         pb.files = files
         pb.html_template = html_template
         pb.dynamic_inclusions = dynamic_inclusions
-
-        # Start conversion from the entrypoint
-        ConvertMarkdownPageToHtmlPage(str(paths['md_entrypoint']), pb)
-
-        # Keep going until all other files are processed
-        if conf['toggles']['process_all'] == True:
-            unparsed = {}
-            for k in files.keys():
-                if files[k]["processed"] == False:
-                    unparsed[k] = files[k]
-
-            i = 0
-            l = len(unparsed.keys())
-            for k in unparsed.keys():
-                i += 1
-                if conf['toggles']['verbose_printout'] == True:
-                    print(f'{i}/{l}')
-                ConvertMarkdownPageToHtmlPage(unparsed[k]['fullpath'], pb)
-
-        # Create tag page
-        recurseTagList(pb.tagtree, 'tags/', pb, level=0)
+        pb.html_renderer = HtmlRenderer(conf, paths, files, html_template, dynamic_inclusions)
+        if conf['toggles']['features']['build_search_index']:
+            pb.search_index = SearchIndex()
+        if conf['jobs'] > 1:
+            pb.html_renderer.StartWorkers(conf['jobs'])
+        try:
+            if pb.manifest is not None:
+                pb.manifest.StartStage('html', GetConfigFingerprint(conf, html_template, json.dumps([markdown_extensions, markdown_extension_configs])))
+
+            # Pre-scan all notes for links, so that the pages to convert, and the links between them, are known up front
+            ProfileStage('html: link index')
+            pb.link_index = BuildMarkdownLinkIndex(files, paths['md_folder'], conf['toggles']['relative_path_md'], pb.link_scan_cache['html'], pb.markdown_pages)
+            entrypoint_key = paths['rel_md_entrypoint_path'].as_posix()
+
+            page_path_strs = []
+            if entrypoint_key not in pb.link_index.numbers.keys():
+                page_path_strs.append(str(paths['md_entrypoint']))
+            for k in pb.link_index.ProcessingOrder(entrypoint_key, conf['toggles']['process_all']):
+                # Mark the file as processed so that it will not be processed again at a later stage
+                n = files.Find(k)
+                files.SetProcessed(n)
+                page_path_strs.append(files.Fullpath(n))
+
+            ProfileStage('html: convert')
+            ConvertMarkdownPagesToHtml(page_path_strs, pb)
+
+            # Create tag pages
+            # The tagtree is complete at this point, so these are handed to the worker processes along with the last pages.
+            # In incremental mode, the tag pages are only rebuilt (from scratch) when the tagtree changed
+            # In watch mode, only the pages of changed tags are rewritten
+            ProfileStage('html: tag pages')
+            if pb.manifest is None:
+                WriteTagPages(pb)
+            elif pb.manifest.OutputChanged('tags', pb.tagtree.IterJson()):
+                if previous_pb is not None and previous_pb.html_renderer is not None:
+                    WriteTagPages(pb, previous_tagtree=previous_pb.tagtree)
+                else:
+                    if paths['html_output_folder'].joinpath('tags').exists():
+                        shutil.rmtree(paths['html_output_folder'].joinpath('tags'))
+                    WriteTagPages(pb)
+
+            # Wait until the worker processes have written all pages
+            ProfileStage('html: wait for workers')
+            pb.html_renderer.WaitForWorkers()
+        finally:
+            # Also when converting failed, so that no worker processes are left behind (e.g. in watch mode)
+            pb.html_renderer.StopWorkers()
+
+        if pb.manifest is not None:
+            ProfileStage('html: remove stale output')
+            pb.manifest.RemoveStaleOutputs('html', paths['html_output_folder'])
+
+        # Write the search index to the static folder
+        if pb.search_index is not None:
+            ProfileStage('html: search index')
+            pb.search_index.Export(paths['html_output_folder'].joinpath(static_folder_name).joinpath('search'))
 
         # Add Extra stuff to the output directories
+        ProfileStage('html: static files')
         ExportStaticFiles(pb)
 
         # Write node json to static folder
-        with open (pb.paths['html_output_folder'].joinpath('98682199-5ac9-448c-afc8-23ab7359a91b-static').joinpath('graph.json'), 'w', encoding="utf-8") as f:
-            f.write(pb.network_tree.OutputJson())
-
-        
-
+        # The neighbourhood shards are derived from the same graph, so they are (re)written together with graph.json
+        ProfileStage('html: graph')
+        graph_json_path = pb.paths['html_output_folder'].joinpath('98682199-5ac9-448c-afc8-23ab7359a91b-static').joinpath('graph.json')
+        graph_shards_path = pb.paths['html_output_folder'].joinpath('98682199-5ac9-448c-afc8-23ab7359a91b-static').joinpath('graph')
+        hops = conf['toggles']['features']['graph_neighbourhood_hops']
+        if pb.manifest is None or pb.manifest.OutputChanged('graph', pb.network_tree.IterJson()) or graph_json_path.exists() == False \
+            or (hops > 0 and graph_shards_path.exists() == False):
+            with open (graph_json_path, 'w', encoding="utf-8") as f:
+                pb.network_tree.WriteJson(f)
+
+            # In watch mode, only the shards that changed since the previous build are rewritten
+            if previous_pb is not None and previous_pb.html_renderer is not None and graph_shards_path.exists():
+                if conf['toggles']['features']['build_graph'] and hops > 0:
+                    pb.network_tree.WriteNeighbourhoodShards(graph_shards_path, hops, previous=previous_pb.network_tree)
+            else:
+                if graph_shards_path.exists():
+                    shutil.rmtree(graph_shards_path)
+                if conf['toggles']['features']['build_graph'] and hops > 0:
+                    pb.network_tree.WriteNeighbourhoodShards(graph_shards_path, hops)
+
+    if pb.manifest is not None and save_manifest:
+        ProfileStage('save manifest')
+        pb.manifest.Save()
+
+    ProfileStage(None)
     print('> DONE')
+    return pb
+
+def WatchAndRebuild(watcher, conf, paths, static_assets, dynamic_inclusions, pb):
+    '''Keeps the process running, and builds again whenever files in the watched folder change (see --watch).
+    Builds are incremental, so that only the changed notes, and the notes that depend on them, are converted again.
+    The manifest is kept in memory, and only saved when the watch is stopped (ctrl+c).'''
+    print(f'> WATCHING {str(watcher.scanner.root_path)} FOR CHANGES (press ctrl+c to stop)')
+    try:
+        while True:
+            changed = watcher.WaitForChanges()
+            print(f'> CHANGED: {", ".join(changed[:5])}' + (f' and {len(changed) - 5} more' if len(changed) > 5 else ''))
+
+            start_time = time.perf_counter()
+            try:
+                pb = Build(conf, paths, static_assets, dynamic_inclusions, previous_pb=pb, save_manifest=False)
+            except Exception:
+                # Keep watching, the next change may fix the problem
+                traceback.print_exc()
+                continue
+            print(f'> REBUILT IN {time.perf_counter() - start_time:.2f}s')
+            WriteProfileReport()
+    except KeyboardInterrupt:
+        if pb.manifest is not None:
+            pb.manifest.Save()
+        print('> STOPPED WATCHING')
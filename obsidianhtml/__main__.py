@@ -1,4 +1,6 @@
 from obsidianhtml import main
 
-main()
+# Guarded, as worker processes (see --jobs) may import this module again
+if __name__ == '__main__':
+    main()
 
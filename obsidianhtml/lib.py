@@ -5,12 +5,17 @@ import frontmatter          # remove yaml frontmatter from md files
 import urllib.parse         # convert link characters like %
 import warnings
 import shutil               # used to remove a non-empty directory, copy files
+import json
+import hashlib
+import importlib.metadata
+from functools import lru_cache
 from string import ascii_letters, digits
 
 # Open source files in the package
 import importlib.resources as pkg_resources
 import importlib.util
 from . import src 
+from .CopyLedger import CopyLedger
  
 # Lookup tables
 image_suffixes = ['jpg', 'jpeg', 'gif', 'png', 'bmp']
@@ -19,6 +24,7 @@ class DuplicateFileNameInRoot(Exception):
     pass
 
 def GetObsidianFilePath(link, file_tree):
+    '''Returns (file name, file number in the FileRegistry or None, header) of the file that an obsidian link points to.'''
     # Remove possible alias suffix, folder prefix, and add '.md' to get a valid lookup key
     # a link can look like this: folder/note#chapter|alias
     # then filename=note, header=chapter
@@ -32,10 +38,49 @@ def GetObsidianFilePath(link, file_tree):
         filename += '.md'
         
     # Return tuple
-    if filename not in file_tree.keys():
-        return (filename, False, '')
+    n = file_tree.Find(filename)
+    if n is None:
+        return (filename, None, '')
 
-    return (filename, file_tree[filename], header)
+    return (filename, n, header)
+
+def NormalizePath(path):
+    '''Like Path.resolve(), but without following symbolic links, so that links that were put in the markdown folder 
+    (attachment_copy_mode: symlink) still count as files in that folder.'''
+    return Path(os.path.normpath(path.absolute()))
+
+def GetConfigFingerprint(config, *extra):
+    '''Hash of everything besides the notes themselves that influences the output: the config, the package version, and e.g. the html template.
+    Toggles that do not influence the output are left out, so that toggling them does not trigger a full rebuild.'''
+    config = json.loads(json.dumps(config, default=str))
+    for key in ('verbose_printout', 'no_clean', 'incremental', 'write_md_folder'):
+        config['toggles'].pop(key, None)
+    for key in ('jobs', 'watch_poll_interval'):
+        config.pop(key, None)
+
+    try:
+        version = importlib.metadata.version('obsidianhtml')
+    except importlib.metadata.PackageNotFoundError:
+        version = 'unknown'
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    fingerprint.update(version.encode('utf-8'))
+    for value in extra:
+        fingerprint.update(value.encode('utf-8'))
+    return fingerprint.hexdigest()
+
+# Files copied to the output by this process during this run (see SetCopyMode)
+_copy_ledger = CopyLedger()
+
+def SetCopyMode(mode):
+    '''Starts a new copy ledger for this process, that puts files in place according to the given attachment_copy_mode.'''
+    global _copy_ledger
+    _copy_ledger = CopyLedger(mode)
+
+def CopyFile(src_path_str, dst_path):
+    '''Copies a file to the output, unless it was already copied during this run or is up to date (see CopyLedger).'''
+    _copy_ledger.Copy(src_path_str, dst_path)
 
 def ConvertTitleToMarkdownId(title):
     idstr = title.lower().strip()
@@ -45,15 +90,20 @@ def ConvertTitleToMarkdownId(title):
     idstr = "".join([ch for ch in idstr if ch in (ascii_letters + digits + ' -')])
     return idstr
 
+# Packaged files don't change while running, so each is only read once per process
+@lru_cache(maxsize=None)
+def GetIncludedFolder():
+    return importlib.util.find_spec("obsidianhtml.src").submodule_search_locations[0]
+
+@lru_cache(maxsize=None)
 def OpenIncludedFile(resource):
-    path = importlib.util.find_spec("obsidianhtml.src").submodule_search_locations[0]
-    path = os.path.join(path, resource)
+    path = os.path.join(GetIncludedFolder(), resource)
     with open(path, 'r', encoding="utf-8") as f:
         return f.read()
 
+@lru_cache(maxsize=None)
 def OpenIncludedFileBinary(resource):
-    path = importlib.util.find_spec("obsidianhtml.src").submodule_search_locations[0]
-    path = os.path.join(path, resource)
+    path = os.path.join(GetIncludedFolder(), resource)
     with open(path, 'rb') as f:
         return f.read()    
 
@@ -61,24 +111,10 @@ def ExportStaticFiles(pb):
     static_folder = pb.paths['html_output_folder'].joinpath('98682199-5ac9-448c-afc8-23ab7359a91b-static')
     os.makedirs(static_folder, exist_ok=True)
 
-    # copy files over (standard copy, static_folder)
-    copy_file_list = ['main.css', 'mermaid.css', 'mermaid.min.js', 'taglist.css', 'external.svg']
-    if pb.config['toggles']['features']['build_graph']:
-        copy_file_list += ['graph.css']
-
-    for file_name in copy_file_list:
-        c = OpenIncludedFile(file_name)
-        with open (static_folder.joinpath(file_name), 'w', encoding="utf-8") as f:
-            f.write(c)
-
-    # copy files over (byte copy, static_folder)
-    copy_file_list_byte = ['SourceCodePro-Regular.ttf']
-    for file_name in copy_file_list_byte:
-        c = OpenIncludedFileBinary(file_name)
-        with open (static_folder.joinpath(file_name), 'wb') as f:
-            f.write(c)
+    # Static files are only written when their content (and so their hashed name) is new
+    pb.static_assets.Export(static_folder)
 
     # Custom copy
     c = OpenIncludedFile('not_created.html')
     with open (pb.paths['html_output_folder'].joinpath('not_created.html'), 'w', encoding="utf-8") as f:
-        f.write(pb.html_template.replace('{dynamic_includes}', '').replace('{content}', c))
\ No newline at end of file
+        f.write(pb.html_renderer.WrapInTemplate(c, ''))
\ No newline at end of file
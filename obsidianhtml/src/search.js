@@ -0,0 +1,125 @@
+// Search box, added to the header of every page when features/build_search_index is enabled.
+// The index (see SearchIndex.py) is split in shards by the first two characters of every word,
+// so a search only loads the shards of the words that are typed.
+(function(){
+        var search_url = document.currentScript.src.replace(/[^\/]*$/, '') + 'search/';
+        var loaded = {};
+        var max_results = 15;
+
+        // Words are runs of letters and digits, like in SearchIndex.Tokenize()
+        function Tokenize(text){
+                return (text.toLowerCase().match(/[\p{L}\p{N}]+/gu) || []).filter(function(token){ return Array.from(token).length >= 2; });
+        }
+
+        function GetShardName(token){
+                var bytes = new TextEncoder().encode(Array.from(token).slice(0, 2).join(''));
+                return Array.from(bytes).map(function(b){ return b.toString(16).padStart(2, '0'); }).join('');
+        }
+
+        // Files are gzipped json. Servers that send them with Content-Encoding: gzip have them unpacked by the browser already.
+        function Load(name){
+                if (!(name in loaded)){
+                        loaded[name] = fetch(search_url + name + '.json.gz').then(function(response){
+                                if (!response.ok){
+                                        return {};
+                                }
+                                return response.arrayBuffer().then(function(buffer){
+                                        var bytes = new Uint8Array(buffer);
+                                        if (bytes[0] == 0x1f && bytes[1] == 0x8b){
+                                                return new Response(new Blob([buffer]).stream().pipeThrough(new DecompressionStream('gzip'))).json();
+                                        }
+                                        return JSON.parse(new TextDecoder().decode(buffer));
+                                });
+                        }).catch(function(){ return {}; });
+                }
+                return loaded[name];
+        }
+
+        // Returns [[title, url], ...] of the pages that contain every word of the query (the last word may be incomplete), best matches first
+        function Search(query){
+                var tokens = Tokenize(query);
+                if (tokens.length == 0){
+                        return Promise.resolve([]);
+                }
+                return Promise.all([Load('docs')].concat(tokens.map(function(token){ return Load(GetShardName(token)); }))).then(function(shards){
+                        var docs = shards[0];
+                        var scores = null;
+                        tokens.forEach(function(token, i){
+                                var shard = shards[i + 1];
+                                var token_scores = {};
+                                for (var key in shard){
+                                        if (key == token || (i == tokens.length - 1 && key.startsWith(token))){
+                                                var postings = shard[key];
+                                                for (var j = 0; j < postings.length; j += 2){
+                                                        token_scores[postings[j]] = Math.max(token_scores[postings[j]] || 0, postings[j + 1]);
+                                                }
+                                        }
+                                }
+                                if (scores === null){
+                                        scores = token_scores;
+                                        return;
+                                }
+                                var combined = {};
+                                for (var doc in scores){
+                                        if (doc in token_scores){
+                                                combined[doc] = scores[doc] + token_scores[doc];
+                                        }
+                                }
+                                scores = combined;
+                        });
+                        return Object.keys(scores).sort(function(a, b){ return scores[b] - scores[a] || a - b; }).slice(0, max_results).map(function(doc){ return docs[doc]; });
+                });
+        }
+
+        function Init(){
+                var header = document.getElementById('header');
+                if (!header){
+                        return;
+                }
+                var box = document.createElement('div');
+                box.className = 'search-box';
+                var input = document.createElement('input');
+                input.type = 'search';
+                input.placeholder = 'Search';
+                var list = document.createElement('ul');
+                list.className = 'search-results';
+                box.appendChild(input);
+                box.appendChild(list);
+                header.appendChild(box);
+
+                var query_count = 0;
+                input.addEventListener('input', function(){
+                        var query_number = ++query_count;
+                        Search(input.value).then(function(results){
+                                // Only show the results of the latest query
+                                if (query_number != query_count){
+                                        return;
+                                }
+                                list.innerHTML = '';
+                                results.forEach(function(result){
+                                        var item = document.createElement('li');
+                                        var link = document.createElement('a');
+                                        link.href = result[1];
+                                        link.textContent = result[0];
+                                        item.appendChild(link);
+                                        list.appendChild(item);
+                                });
+                        });
+                });
+                input.addEventListener('keydown', function(event){
+                        if (event.key == 'Enter' && list.firstChild){
+                                window.location.href = list.firstChild.firstChild.href;
+                        }
+                        if (event.key == 'Escape'){
+                                input.value = '';
+                                list.innerHTML = '';
+                        }
+                });
+        }
+
+        if (document.readyState == 'loading'){
+                document.addEventListener('DOMContentLoaded', Init);
+        } else {
+                Init();
+        }
+})();
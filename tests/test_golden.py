@@ -0,0 +1,192 @@
+import io
+import os
+import sys
+import json
+import gzip
+import shutil
+import tempfile
+import unittest
+import warnings
+import contextlib
+from pathlib import Path    #
+
+import yaml
+
+import obsidianhtml
+from obsidianhtml.StaticAssets import static_folder_name
+from obsidianhtml.NetworkTree import GetShardBucket
+from obsidianhtml.SearchIndex import GetShardName
+
+# Vault of which the output is compared against the expected output, file by file.
+# The vault covers every link form that ConvertObsidianPageToMarkdownPage() rewrites, and the documented changes
+# in its output (see "Behaviour changes" in vault/index.md). Pages are rendered with a minimal html template.
+golden_path = Path(__file__).parent.joinpath('golden').resolve()
+vault_path = golden_path.joinpath('vault')
+expected_path = golden_path.joinpath('expected')
+
+# Files in the output that are not compared: the static files (css/js of the package) and the manifest
+skipped_output = [static_folder_name, '.obsidianhtml-manifest.json']
+
+# Features that are off in the golden output, and are checked on their own. Tag pages hold one note each, so that the tag "golden" gets two pages.
+all_features = {'build_graph': True, 'build_search_index': True, 'graph_neighbourhood_hops': 1, 'tag_page_size': 1}
+
+def BuildVault(output_path, jobs=1, features=None):
+    """Convert the vault to markdown and html in output_path/md and output_path/html, using `jobs` processes.
+    The graph and the search index are only built when they are enabled in `features` (see toggles/features in the config)."""
+    conf = {
+        'obsidian_folder_path_str': str(vault_path),
+        'obsidian_entrypoint_path_str': str(vault_path.joinpath('index.md')),
+        'md_folder_path_str': str(output_path.joinpath('md')),
+        'md_entrypoint_path_str': str(output_path.joinpath('md', 'index.md')),
+        'html_output_folder_path_str': str(output_path.joinpath('html')),
+        'site_name': 'Golden',
+        'html_url_prefix': '',
+        'html_template_path_str': str(golden_path.joinpath('template.html')),
+        'exclude_subfolders': ['.obsidian'],
+        'jobs': jobs,
+        'toggles': {
+            'compile_md': True,
+            'compile_html': True,
+            'process_all': True,
+            'verbose_printout': False,
+            'allow_duplicate_filenames_in_root': False,
+            'warn_on_skipped_image': True,
+            'no_clean': False,
+            'relative_path_md': True,
+            'features': features or {'build_graph': False, 'build_search_index': False},
+        },
+    }
+    output_path.mkdir(parents=True, exist_ok=True)
+    config_path = output_path.joinpath('config.yml')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.dump(conf, f)
+
+    argv = sys.argv
+    sys.argv = ['obsidianhtml', '-i', str(config_path)]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            obsidianhtml.main()
+    finally:
+        sys.argv = argv
+    os.remove(config_path)
+
+def ListFiles(folder_path, skipped_output=skipped_output):
+    """Paths (posix, relative to folder_path) of all files in the folder, except skipped_output."""
+    rel_paths = []
+    for root, folders, files in os.walk(folder_path):
+        folders[:] = [folder for folder in folders if folder not in skipped_output]
+        for name in files:
+            if name not in skipped_output:
+                rel_paths.append(Path(root).joinpath(name).relative_to(folder_path).as_posix())
+    return sorted(rel_paths)
+
+def UpdateExpectedOutput():
+    """Replace the expected output by the current output. Check the changes (git diff) before committing them."""
+    with tempfile.TemporaryDirectory() as tmp:
+        BuildVault(Path(tmp))
+        shutil.rmtree(expected_path, ignore_errors=True)
+        for rel_path in ListFiles(Path(tmp)):
+            expected_path.joinpath(rel_path).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(Path(tmp).joinpath(rel_path), expected_path.joinpath(rel_path))
+
+class GoldenOutputTest(unittest.TestCase):
+    maxDiff = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.output_path = Path(cls.tmp.name)
+        BuildVault(cls.output_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def assertOutputEqual(self, folder):
+        expected_files = ListFiles(expected_path.joinpath(folder))
+        self.assertEqual(ListFiles(self.output_path.joinpath(folder)), expected_files)
+        for rel_path in expected_files:
+            with self.subTest(file=f'{folder}/{rel_path}'):
+                expected = expected_path.joinpath(folder, rel_path).read_bytes()
+                output = self.output_path.joinpath(folder, rel_path).read_bytes()
+                if rel_path.endswith(('.md', '.html')):
+                    self.assertEqual(output.decode('utf-8'), expected.decode('utf-8'))
+                else:
+                    self.assertEqual(output, expected)
+
+    def test_markdown_output(self):
+        self.assertOutputEqual('md')
+
+    def test_html_output(self):
+        self.assertOutputEqual('html')
+
+    def test_behaviour_changes(self):
+        # Documented changes in the output of the single-pass rewrites (see docs/developer_docs.md), checked here on their own
+        # so that a change of the expected output does not undo them unnoticed.
+        with open(self.output_path.joinpath('md', 'index.md'), encoding='utf-8') as f:
+            page = f.read()
+        # Nested brackets are matched from the first "[[", so [[[Note A]]] looks for a note named "[Note A"
+        self.assertIn('[[Note A](/not_created.md)]', page)
+        # An image link followed by another ")" on the same line is resolved
+        self.assertIn('(see ![](img/other.png))', page)
+        # Tags and urls are replaced where they are found, not wherever their text occurs in the page
+        self.assertIn('**tag** and **tagsub**', page)
+        self.assertIn('[https://example.com/a](https://example.com/a) and [https://example.com/a/b](https://example.com/a/b)', page)
+
+class FeatureBuildTest(unittest.TestCase):
+    """Builds the vault with the graph, the search index and paginated tag pages, both in one process and with --jobs 2."""
+    maxDiff = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.serial_path = Path(cls.tmp.name).joinpath('serial')
+        cls.parallel_path = Path(cls.tmp.name).joinpath('parallel')
+        BuildVault(cls.serial_path, features=dict(all_features))
+        BuildVault(cls.parallel_path, jobs=2, features=dict(all_features))
+        cls.static_path = cls.serial_path.joinpath('html', static_folder_name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_parallel_output(self):
+        # Everything, including the static folder, is the same whichever process converts a note
+        files = ListFiles(self.serial_path, skipped_output=[])
+        self.assertEqual(ListFiles(self.parallel_path, skipped_output=[]), files)
+        for rel_path in files:
+            with self.subTest(file=rel_path):
+                self.assertEqual(self.parallel_path.joinpath(rel_path).read_bytes(), self.serial_path.joinpath(rel_path).read_bytes())
+
+    def test_graph(self):
+        with open(self.static_path.joinpath('graph.json'), encoding='utf-8') as f:
+            graph = json.load(f)
+        self.assertEqual(sorted(node['id'] for node in graph['nodes']), ['Included', 'Note A', 'Note B', 'Note D', 'Note With Space', 'index'])
+        self.assertIn({'source': 'index', 'target': 'Note A', 'value': 7}, graph['links'])
+
+        # The page of a note loads the shard with its neighbourhood
+        bucket = GetShardBucket('Note A')
+        with open(self.static_path.joinpath('graph', f'{bucket}.json'), encoding='utf-8') as f:
+            shard = json.load(f)
+        neighbourhood = shard['shards'][shard['notes']['Note A']]
+        self.assertIn('index', [node['id'] for node in neighbourhood['nodes']])
+        self.assertIn(f'/{static_folder_name}/graph/{bucket}.json', self.serial_path.joinpath('html', 'Note A.html').read_text(encoding='utf-8'))
+
+    def test_search_index(self):
+        documents = json.loads(gzip.decompress(self.static_path.joinpath('search', 'docs.json.gz').read_bytes()))
+        shard = json.loads(gzip.decompress(self.static_path.joinpath('search', f'{GetShardName("image")}.json.gz').read_bytes()))
+        # [page number, weight, ...] of the pages with the word "image"
+        pages = [documents[n][1] for n in shard['image'][0::2]]
+        self.assertIn('/Note B.html', pages)
+
+    def test_tag_pages(self):
+        self.assertTrue(self.serial_path.joinpath('html', 'tags', 'golden', 'page-2.html').exists())
+        with open(self.serial_path.joinpath('html', 'tags', 'golden', 'index.json'), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['pages'], 2)
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--update']:
+        UpdateExpectedOutput()
+    else:
+        unittest.main()